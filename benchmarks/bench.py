@@ -0,0 +1,259 @@
+"""
+End-to-end throughput benchmark of --scan, --send-forms and --process-forms
+against the fake Google APIs and the MySQL database configured in .env.
+
+    python -m benchmarks.bench --sizes 10000,100000 --output report.json
+    python -m benchmarks.bench --baseline report.json
+
+Every command runs in its own process so that its peak RSS is measured on
+its own. The database is emptied before every tenant size.
+"""
+
+import argparse
+from benchmarks.fake_google import (
+    FakeGoogleAPI,
+    FakeTenant,
+)
+import json
+import os
+from pathlib import (
+    Path,
+)
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import (
+    Any,
+)
+
+DEFAULT_SIZES = "10000,100000,1000000"
+COMMANDS = ("scan", "send-forms", "process-forms")
+TABLES = (
+    "google_forms_files",
+    "google_forms",
+    "google_drive_files",
+    "google_drive_users",
+    "drive_scan_state",
+    "drive_scan_checkpoint",
+    "email_outbox",
+)
+# The fake APIs have no quota, the limiters must not be the bottleneck
+UNLIMITED_QUOTAS = {
+    f"{api}_RATE_{period}": value
+    for api in ("DRIVE", "FORMS", "GMAIL")
+    for period, value in (("PER_SECOND", "1000000"), ("PER_DAY", "0"))
+}
+
+
+class FakeCredentialProvider:
+    def __init__(self) -> None:
+        self._credentials = object()
+
+    def get(self) -> Any:
+        return self._credentials
+
+
+def _count_queries(connection: Any) -> int:
+    cursor = connection.cursor()
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+    result = int(cursor.fetchone()[1])
+    cursor.close()
+    return result
+
+
+def _run_command(args: argparse.Namespace) -> dict[str, Any]:
+    os.environ.update(UNLIMITED_QUOTAS)
+    os.environ["FORMS_ALLOWED_USERS"] = ""
+
+    # pylint: disable=import-outside-toplevel
+    from src.commands.process_forms import (
+        process_results,
+    )
+    from src.commands.scan import (
+        scan_user_files,
+    )
+    from src.commands.send_forms import (
+        send_severity_forms,
+    )
+    from src.credentials import (
+        set_credential_provider,
+    )
+    from src.database import (
+        get_connection,
+    )
+    from src.services import (
+        set_service_builder,
+    )
+
+    api = FakeGoogleAPI(
+        FakeTenant(args.files, users=args.users),
+        latency=args.latency,
+        max_page_size=args.page_size,
+        error_rate=args.error_rate,
+        state_path=Path(args.state_dir) / "forms.json",
+    )
+    set_service_builder(api.build)
+    set_credential_provider(FakeCredentialProvider())
+
+    command = {
+        "scan": lambda: scan_user_files(full_scan=True),
+        "send-forms": send_severity_forms,
+        "process-forms": process_results,
+    }[args.child]
+    connection = get_connection()
+    queries_before = _count_queries(connection)
+    start = time.perf_counter()
+    command()
+    elapsed = time.perf_counter() - start
+    # The SHOW STATUS query itself is counted too
+    db_round_trips = _count_queries(connection) - queries_before - 1
+    connection.close()
+    api.save()
+
+    return {
+        "command": args.child,
+        "files": args.files,
+        "seconds": round(elapsed, 3),
+        "files_per_second": round(args.files / elapsed, 1),
+        "api_calls": sum(api.calls.values()),
+        "api_calls_by_method": dict(api.calls),
+        "api_errors_injected": sum(api.errors.values()),
+        "db_round_trips": db_round_trips,
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def _reset_database() -> None:
+    # pylint: disable=import-outside-toplevel
+    from src.database import (
+        get_connection,
+    )
+
+    connection = get_connection()
+    cursor = connection.cursor()
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in TABLES:
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    cursor.close()
+    connection.close()
+
+
+def _run_size(args: argparse.Namespace, size: int) -> list[dict[str, Any]]:
+    _reset_database()
+    results = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        for command in args.commands.split(","):
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.bench",
+                    "--child",
+                    command,
+                    "--files",
+                    str(size),
+                    "--users",
+                    str(args.users),
+                    "--latency",
+                    str(args.latency),
+                    "--page-size",
+                    str(args.page_size),
+                    "--error-rate",
+                    str(args.error_rate),
+                    "--state-dir",
+                    state_dir,
+                ],
+                capture_output=True,
+                check=True,
+                text=True,
+            )
+            result = json.loads(process.stdout.splitlines()[-1])
+            print(
+                f"{size:>9} {command:<14} {result['seconds']:>9.2f}s "
+                f"{result['files_per_second']:>11.1f} files/s "
+                f"{result['api_calls']:>9} api "
+                f"{result['db_round_trips']:>9} db "
+                f"{result['peak_rss_mb']:>8.1f} MB",
+                flush=True,
+            )
+            results.append(result)
+    return results
+
+
+def _compare(
+    results: list[dict[str, Any]], baseline_path: Path, tolerance: float
+) -> list[str]:
+    baseline = {
+        (result["files"], result["command"]): result
+        for result in json.loads(baseline_path.read_text(encoding="utf-8"))
+    }
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["files"], result["command"]))
+        if previous and result["files_per_second"] < previous[
+            "files_per_second"
+        ] * (1 - tolerance):
+            regressions.append(
+                f"{result['command']} with {result['files']} files: "
+                f"{result['files_per_second']} files/s, was "
+                f"{previous['files_per_second']}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    parser.add_argument("--commands", default=",".join(COMMANDS))
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per API call"
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=1000, help="Largest page served"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of API calls answered with a 429",
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed files per second drop against the baseline",
+    )
+    parser.add_argument("--child", choices=COMMANDS, help=argparse.SUPPRESS)
+    parser.add_argument("--files", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--state-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_run_command(args)))
+        return
+
+    results = [
+        result
+        for size in args.sizes.split(",")
+        for result in _run_size(args, int(size))
+    ]
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline:
+        regressions = _compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
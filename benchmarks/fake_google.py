@@ -0,0 +1,356 @@
+"""
+In-process stand-ins for the Drive v3, Forms v1 and Gmail v1 endpoints used
+by the application. They mimic the discovery clients closely enough to be
+returned by src.services.get_service, with configurable latency, page
+sizes and error injection, and count every call by method.
+"""
+
+from collections import (
+    Counter,
+)
+from googleapiclient.errors import (
+    HttpError,
+)
+import hashlib
+import httplib2
+import json
+from pathlib import (
+    Path,
+)
+import random
+from src.severity import (
+    ANSWER_WEIGHTS,
+)
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+)
+
+RATE_LIMIT_ERROR = json.dumps(
+    {
+        "error": {
+            "code": 429,
+            "message": "Rate Limit Exceeded",
+            "errors": [{"reason": "rateLimitExceeded"}],
+        }
+    }
+).encode()
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()
+
+
+class FakeTenant:
+    """
+    A synthetic Drive of `files` files owned by `users` users. Files are
+    generated from their index when requested, so a tenant of a million
+    files costs no memory.
+    """
+
+    def __init__(
+        self, files: int, users: int = 100, public_ratio: float = 0.1
+    ) -> None:
+        self.files = files
+        self.users = users
+        self.public_ratio = public_ratio
+
+    def user(self, index: int) -> dict[str, str]:
+        return {
+            "emailAddress": f"user{index}@bench.example",
+            "displayName": f"User {index}",
+        }
+
+    def file(self, index: int) -> dict[str, Any]:
+        owner = self.user(index % self.users)
+        permissions = [
+            {"id": f"perm-{index}", "type": "user", **owner},
+        ]
+        if int(_digest("public", index)[:8], 16) / 0xFFFFFFFF < (
+            self.public_ratio
+        ):
+            permissions.append({"id": "anyoneWithLink", "type": "anyone"})
+        return {
+            "id": f"file-{index:08d}",
+            "name": f"Document {index}",
+            "fullFileExtension": "docx",
+            "originalFilename": f"document-{index}.docx",
+            "owners": [owner],
+            "permissions": permissions,
+            "webViewLink": f"https://drive.example/file-{index:08d}",
+        }
+
+
+class FakeRequest:
+    def __init__(
+        self,
+        api: "FakeGoogleAPI",
+        method_id: str,
+        handler: Callable[..., Any],
+        **params: Any,
+    ) -> None:
+        self.api = api
+        self.methodId = method_id  # pylint: disable=invalid-name
+        self.handler = handler
+        self.params = params
+
+    def execute(self, num_retries: int = 0) -> Any:
+        del num_retries
+        self.api.call(self.methodId)
+        return self.handler(**self.params)
+
+
+class FakeBatch:
+    def __init__(
+        self, api: "FakeGoogleAPI", callback: Callable[..., None]
+    ) -> None:
+        self.api = api
+        self.callback = callback
+        self.requests: list[tuple[str, FakeRequest]] = []
+
+    def add(self, request: FakeRequest, request_id: str) -> None:
+        self.requests.append((request_id, request))
+
+    def execute(self) -> None:
+        self.api.call("batch")
+        for request_id, request in self.requests:
+            try:
+                self.api.call(request.methodId, latency=False)
+                response = request.handler(**request.params)
+            except HttpError as error:
+                self.callback(request_id, None, error)
+            else:
+                self.callback(request_id, response, None)
+
+
+class _Resource:
+    def __init__(self, api: "FakeGoogleAPI", prefix: str, **methods: Any):
+        self._api = api
+        self._prefix = prefix
+        self._methods = methods
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        method = self._methods[name]
+        if isinstance(method, _Resource):
+            return lambda: method
+        if name == "list_next":
+            return method
+        return lambda **params: FakeRequest(
+            self._api, f"{self._prefix}.{name}", method, **params
+        )
+
+
+class FakeGoogleAPI:
+    """
+    Builds fake clients through `build`, which has the signature of
+    googleapiclient.discovery.build, and holds their shared state.
+    """
+
+    def __init__(
+        self,
+        tenant: FakeTenant,
+        *,
+        latency: float = 0.0,
+        max_page_size: int = 1000,
+        error_rate: float = 0.0,
+        state_path: Path | None = None,
+        seed: int = 0,
+    ) -> None:
+        self.tenant = tenant
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.state_path = state_path
+        self.calls: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._forms: dict[str, list[str]] = {}
+        if state_path and state_path.exists():
+            self._forms = json.loads(state_path.read_text(encoding="utf-8"))
+
+    def call(self, method_id: str, latency: bool = True) -> None:
+        with self._lock:
+            self.calls[method_id] += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors[method_id] += 1
+        if latency and self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise HttpError(
+                httplib2.Response({"status": 429}), RATE_LIMIT_ERROR
+            )
+
+    def save(self) -> None:
+        if self.state_path:
+            self.state_path.write_text(
+                json.dumps(self._forms), encoding="utf-8"
+            )
+
+    def build(self, api: str, version: str, **kwargs: Any) -> Any:
+        del version, kwargs
+        return {
+            "drive": self._drive,
+            "forms": self._forms_service,
+            "gmail": self._gmail,
+        }[api]()
+
+    def _page(self, page_token: str | None, page_size: int) -> tuple[int, int]:
+        start = int(page_token or 0)
+        return start, min(
+            start + min(page_size, self.max_page_size), self.tenant.files
+        )
+
+    def _drive(self) -> Any:
+        def files_list(
+            pageSize: int = 100, pageToken: str | None = None, **_: Any
+        ) -> dict[str, Any]:
+            start, end = self._page(pageToken, pageSize)
+            return {
+                "files": [
+                    self.tenant.file(index) for index in range(start, end)
+                ],
+                **(
+                    {"nextPageToken": str(end)}
+                    if end < self.tenant.files
+                    else {}
+                ),
+            }
+
+        def files_list_next(
+            previous_request: FakeRequest, previous_response: dict[str, Any]
+        ) -> FakeRequest | None:
+            if "nextPageToken" not in previous_response:
+                return None
+            return FakeRequest(
+                self,
+                previous_request.methodId,
+                files_list,
+                **{
+                    **previous_request.params,
+                    "pageToken": previous_response["nextPageToken"],
+                },
+            )
+
+        service = _Resource(
+            self,
+            "drive",
+            files=_Resource(
+                self, "drive.files", list=files_list, list_next=files_list_next
+            ),
+            changes=_Resource(
+                self,
+                "drive.changes",
+                getStartPageToken=lambda: {"startPageToken": "1"},
+                list=lambda pageToken, **_: {
+                    "changes": [],
+                    "newStartPageToken": pageToken,
+                },
+            ),
+            permissions=_Resource(
+                self,
+                "drive.permissions",
+                list=lambda fileId, **_: {
+                    "permissions": self.tenant.file(int(fileId.split("-")[1]))[
+                        "permissions"
+                    ]
+                },
+                delete=lambda fileId, permissionId: "",
+            ),
+        )
+        service.new_batch_http_request = lambda callback: FakeBatch(
+            self, callback
+        )
+        return service
+
+    def _forms_service(self) -> Any:
+        def create(body: dict[str, Any]) -> dict[str, Any]:
+            with self._lock:
+                form_id = f"form-{len(self._forms):08d}"
+                self._forms[form_id] = []
+            return {
+                "formId": form_id,
+                "responderUri": f"https://forms.example/{form_id}",
+                "info": body["info"],
+            }
+
+        def batch_update(formId: str, body: dict[str, Any]) -> dict[str, Any]:
+            question_ids = [
+                _digest(formId, index)[:8]
+                for index in range(len(body["requests"]))
+            ]
+            with self._lock:
+                self._forms[formId].extend(question_ids)
+            return {
+                "replies": [
+                    {"createItem": {"questionId": [question_id]}}
+                    for question_id in question_ids
+                ]
+            }
+
+        options = list(ANSWER_WEIGHTS)
+
+        def responses_list(formId: str, **_: Any) -> dict[str, Any]:
+            return {
+                "responses": [
+                    {
+                        "responseId": f"{formId}-response",
+                        "answers": {
+                            question_id: {
+                                "questionId": question_id,
+                                "textAnswers": {
+                                    "answers": [
+                                        {
+                                            "value": options[
+                                                int(question_id, 16)
+                                                % len(options)
+                                            ]
+                                        }
+                                    ]
+                                },
+                            }
+                            for question_id in self._forms.get(formId, [])
+                        },
+                    }
+                ]
+            }
+
+        responses = _Resource(
+            self,
+            "forms.forms.responses",
+            list=responses_list,
+            list_next=lambda previous_request, previous_response: None,
+        )
+        return _Resource(
+            self,
+            "forms",
+            forms=_Resource(
+                self,
+                "forms.forms",
+                create=create,
+                batchUpdate=batch_update,
+                responses=responses,
+            ),
+        )
+
+    def _gmail(self) -> Any:
+        def send(userId: str, body: dict[str, Any]) -> dict[str, Any]:
+            del userId
+            return {"id": _digest(body["raw"])[:16], "labelIds": ["SENT"]}
+
+        messages = _Resource(self, "gmail.users.messages", send=send)
+        return _Resource(
+            self,
+            "gmail",
+            users=_Resource(
+                self,
+                "gmail.users",
+                getProfile=lambda userId: {
+                    "emailAddress": "bench@bench.example"
+                },
+                messages=messages,
+            ),
+        )
@@ -0,0 +1,81 @@
+"""
+Checks that importing the CLI stays under a startup budget and loads none
+of the heavy client libraries, which only the commands may import.
+
+    python -m benchmarks.importtime --budget-ms 50
+
+The import is measured with python -X importtime in fresh processes and
+the fastest of --runs runs is compared against the budget.
+"""
+
+import argparse
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = 50.0
+DEFAULT_RUNS = 5
+MODULE = "src"
+HEAVY_MODULES = (
+    "google_auth_oauthlib",
+    "googleapiclient",
+    "mysql",
+    "numpy",
+    "pyarrow",
+)
+
+
+def _measure(module: str) -> tuple[float, set[str]]:
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    cumulative_us = 0
+    imported = set()
+    # import time: self [us] | cumulative | imported package
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        imported.add(name.strip().split(".")[0])
+        # Nested imports are indented, only the top level one is wanted
+        if name == f" {module}":
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, imported
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args()
+
+    measures = [_measure(MODULE) for _ in range(args.runs)]
+    elapsed_ms = min(elapsed for elapsed, _ in measures)
+    heavy = sorted(set(HEAVY_MODULES) & measures[0][1])
+    print(
+        f"import {MODULE}: {elapsed_ms:.1f} ms "
+        f"(budget {args.budget_ms:.1f} ms)"
+    )
+    failed = False
+    if elapsed_ms > args.budget_ms:
+        print(
+            f"Startup over budget by {elapsed_ms - args.budget_ms:.1f} ms",
+            file=sys.stderr,
+        )
+        failed = True
+    if heavy:
+        print(
+            f"Heavy modules imported at startup: {', '.join(heavy)}",
+            file=sys.stderr,
+        )
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import logging
+import mysql.connector
+from mysql.connector.connection import (
+    MySQLConnection,
+)
+from src.rate_limit import (
+    execute_request,
+)
+from src.users import (
+    DRIVE_FILE_FIELDS,
+    MAX_PAGE_SIZE,
+)
+from typing import (
+    Any,
+    Iterator,
+    NamedTuple,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+CHANGES_TOKEN_KEY = "changes_page_token"
+SCAN_CHECKPOINT_KEY = "scan"
+SCAN_FILES = "files"
+SCAN_CHANGES = "changes"
+# Drive answers with these statuses when a stored page token is no longer
+# valid, in which case a full scan is needed to get a new one
+EXPIRED_TOKEN_STATUSES = (404, 410)
+# files.list rejects a page token saved by an interrupted scan with a 400
+# as well once it is no longer valid
+REJECTED_PAGE_TOKEN_STATUSES = (400, *EXPIRED_TOKEN_STATUSES)
+
+
+def get_changes_token(connection: MySQLConnection) -> str | None:
+    query = """
+    SELECT state_value FROM drive_scan_state WHERE state_key = %s;
+    """
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute(query, (CHANGES_TOKEN_KEY,))
+    result = cursor.fetchone()
+    cursor.close()
+    return result["state_value"] if result else None
+
+
+class ScanCheckpoint(NamedTuple):
+    kind: str
+    # The next page to read, None before the first one
+    page_token: str | None
+    # The changes token to store when a full scan completes
+    start_page_token: str | None
+    pages: int = 0
+    items: int = 0
+
+
+def get_scan_checkpoint(connection: MySQLConnection) -> ScanCheckpoint | None:
+    query = """
+    SELECT scan_kind, page_token, start_page_token, pages, items
+    FROM drive_scan_checkpoint WHERE checkpoint_key = %s;
+    """
+    cursor = connection.cursor()
+    cursor.execute(query, (SCAN_CHECKPOINT_KEY,))
+    result = cursor.fetchone()
+    cursor.close()
+    return ScanCheckpoint(*result) if result else None
+
+
+def save_scan_checkpoint(
+    connection: MySQLConnection, checkpoint: ScanCheckpoint
+) -> None:
+    try:
+        cursor = connection.cursor()
+        query = (
+            "INSERT INTO drive_scan_checkpoint (checkpoint_key, scan_kind, "
+            "page_token, start_page_token, pages, items) "
+            "VALUES (%s, %s, %s, %s, %s, %s) AS new "
+            "ON DUPLICATE KEY UPDATE scan_kind = new.scan_kind, "
+            "page_token = new.page_token, "
+            "start_page_token = new.start_page_token, "
+            "pages = new.pages, items = new.items"
+        )
+        cursor.execute(query, (SCAN_CHECKPOINT_KEY, *checkpoint))
+        connection.commit()
+        cursor.close()
+    except mysql.connector.Error as err:
+        LOGGER.error("Failed to store scan checkpoint: %s", err)
+        raise
+
+
+def clear_scan_checkpoint(connection: MySQLConnection) -> None:
+    cursor = connection.cursor()
+    cursor.execute(
+        "DELETE FROM drive_scan_checkpoint WHERE checkpoint_key = %s",
+        (SCAN_CHECKPOINT_KEY,),
+    )
+    connection.commit()
+    cursor.close()
+
+
+def complete_scan(connection: MySQLConnection, page_token: str) -> None:
+    """
+    Stores the changes token for the next run and drops the checkpoint in
+    one transaction, so a crash in between cannot resume a finished scan.
+    """
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "INSERT INTO drive_scan_state (state_key, state_value) "
+            "VALUES (%s, %s) AS new "
+            "ON DUPLICATE KEY UPDATE state_value = new.state_value",
+            (CHANGES_TOKEN_KEY, page_token),
+        )
+        cursor.execute(
+            "DELETE FROM drive_scan_checkpoint WHERE checkpoint_key = %s",
+            (SCAN_CHECKPOINT_KEY,),
+        )
+        connection.commit()
+        cursor.close()
+    except mysql.connector.Error as err:
+        connection.rollback()
+        LOGGER.error("Failed to complete the scan: %s", err)
+        raise
+
+
+def get_start_page_token(service: Any) -> str:
+    return execute_request(service.changes().getStartPageToken(), "drive")[
+        "startPageToken"
+    ]
+
+
+def get_changes_pages(
+    service: Any, page_token: str, page_size: int = MAX_PAGE_SIZE
+) -> Iterator[tuple[list[dict[str, Any]], str | None, str | None]]:
+    """
+    Yields the changes since page_token one page at a time together with
+    the token of the next page and the token to store for the next run,
+    which Drive only returns on the last page.
+    """
+    while page_token is not None:
+        results = execute_request(
+            service.changes().list(
+                pageToken=page_token,
+                pageSize=page_size,
+                includeRemoved=True,
+                fields=(
+                    "nextPageToken, newStartPageToken, changes(fileId, "
+                    f"removed, file({DRIVE_FILE_FIELDS}, trashed))"
+                ),
+            ),
+            "drive",
+        )
+        page_token = results.get("nextPageToken")
+        yield (
+            results.get("changes", []),
+            page_token,
+            results.get("newStartPageToken"),
+        )
+
+
+def split_changes(
+    changes: list[dict[str, Any]]
+) -> tuple[list[dict[str, Any]], list[str]]:
+    """
+    Returns the files to upsert and the ids of the files to remove.
+    """
+    changed: list[dict[str, Any]] = []
+    removed: list[str] = []
+    for change in changes:
+        if "fileId" not in change:
+            continue
+        file = change.get("file")
+        if change.get("removed") or not file or file.get("trashed"):
+            removed.append(change["fileId"])
+        elif file.get("owners"):
+            changed.append(file)
+    return changed, removed
@@ -0,0 +1,55 @@
+import argparse
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+from src.commands.process_forms import (
+    process_results,
+)
+from src.commands.scan import (
+    scan_user_files,
+)
+from src.commands.send_emails import (
+    send_queued_emails,
+)
+from src.commands.send_forms import (
+    send_severity_forms,
+)
+from src.daemon import (
+    run_daemon,
+)
+from src.database import (
+    get_connection_pool,
+)
+from src.forms import (
+    get_forms_concurrency,
+)
+from src.outbox import (
+    get_outbox_workers,
+)
+
+
+def run(args: argparse.Namespace) -> None:
+    del args
+    # One pool for every cycle, and one executor whose threads keep their
+    # Forms and Gmail clients between runs, as the worker threads of the
+    # daemon keep the Drive client
+    pool = get_connection_pool()
+    with ThreadPoolExecutor(
+        max_workers=max(get_forms_concurrency(), get_outbox_workers()),
+        thread_name_prefix="daemon-api",
+    ) as executor:
+        run_daemon(
+            {
+                # A scan cut short by an error continues on the next cycle
+                "scan": lambda: scan_user_files(
+                    connection_pool=pool,
+                    resume=True,
+                    warn_no_checkpoint=False,
+                ),
+                "send-forms": lambda: send_severity_forms(pool, executor),
+                "process-forms": lambda: process_results(pool, executor),
+                "send-emails": lambda: send_queued_emails(
+                    pool, executor=executor
+                ),
+            }
+        )
@@ -0,0 +1,42 @@
+import argparse
+import logging
+from src.database import (
+    get_connection_pool,
+)
+from src.export import (
+    export_inventory,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+
+def export_files(
+    output: str,
+    export_format: str | None = None,
+    *,
+    severities: tuple[str, ...] = (),
+    owner: str | None = None,
+    is_public: bool | None = None,
+) -> None:
+    export_format = export_format or (
+        "parquet" if output.endswith(".parquet") else "csv"
+    )
+    exported = export_inventory(
+        get_connection_pool(),
+        output,
+        export_format,
+        severities=severities,
+        owner=owner,
+        is_public=is_public,
+    )
+    LOGGER.warning("Exported %s files to %s", exported, output)
+
+
+def run(args: argparse.Namespace) -> None:
+    export_files(
+        args.export,
+        args.format,
+        severities=tuple(args.severity),
+        owner=args.owner,
+        is_public=args.public,
+    )
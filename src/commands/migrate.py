@@ -0,0 +1,26 @@
+import argparse
+import logging
+from src.database import (
+    get_connection_pool,
+)
+from src.migrations import (
+    run_migrations,
+    verify_indexes,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+
+def migrate_database() -> None:
+    connection_pool = get_connection_pool()
+    with connection_pool.get_connection() as connection:
+        applied = run_migrations(connection)
+        missing_indexes = verify_indexes(connection)
+    LOGGER.warning("Applied %s migrations", len(applied))
+    if missing_indexes:
+        LOGGER.error("Missing indexes: %s", ", ".join(missing_indexes))
+
+
+def run(args: argparse.Namespace) -> None:
+    del args
+    migrate_database()
@@ -0,0 +1,151 @@
+import argparse
+from collections import (
+    Counter,
+)
+from concurrent.futures import (
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+)
+from contextlib import (
+    nullcontext,
+)
+from googleapiclient.errors import (
+    HttpError,
+)
+import logging
+from src.commands.send_emails import (
+    send_queued_emails,
+)
+from src.credentials import (
+    get_user_credentials,
+)
+from src.database import (
+    ConnectionPool,
+    get_connection_pool,
+)
+from src.email_manage import (
+    get_me,
+)
+from src.files import (
+    iter_public_files_by_owner,
+    set_files_severity,
+)
+from src.forms import (
+    flatten_question_answers,
+    get_form_responses,
+    get_forms_concurrency,
+    get_user_forms,
+)
+from src.metrics import (
+    METRICS,
+)
+from src.outbox import (
+    OutboxEmail,
+    add_outbox_emails,
+    change_permission_email,
+    get_outbox_workers,
+    send_recipient_emails,
+)
+from src.severity import (
+    SeverityScorer,
+)
+from typing import (
+    Any,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+
+def _read_form_responses(form: dict[str, Any]) -> list[dict[str, Any]]:
+    # A form that cannot be read, e.g. deleted, must not lose the answers
+    # of the others
+    try:
+        return get_form_responses(get_user_credentials(), form["form_id"])
+    except HttpError as error:
+        LOGGER.error(
+            "Failed to read the responses of form %s: %s",
+            form["form_id"],
+            error,
+        )
+        return []
+
+
+def process_results(
+    connection_pool: ConnectionPool | None = None,
+    executor: Executor | None = None,
+) -> None:
+    connection_pool = connection_pool or get_connection_pool()
+    credentials = get_user_credentials()
+    user_me = get_me(credentials)
+    with connection_pool.get_connection() as connection:
+        all_forms = get_user_forms(connection, user_me["emailAddress"])
+
+    # Every form is read at once and the severities are only written once
+    # the answers of all of them are known
+    with METRICS.time(
+        "stage_seconds", command="process-forms", stage="fetch_responses"
+    ), (
+        nullcontext(executor)
+        if executor
+        else ThreadPoolExecutor(max_workers=get_forms_concurrency())
+    ) as worker:
+        question_ids, answers = flatten_question_answers(
+            worker.map(_read_form_responses, all_forms)
+        )
+    with METRICS.time("stage_seconds", command="process-forms", stage="score"):
+        severities = SeverityScorer.from_env().score(question_ids, answers)
+    with METRICS.time(
+        "stage_seconds", command="process-forms", stage="update_severity"
+    ):
+        updated_files = set_files_severity(connection_pool, severities.items())
+    LOGGER.info("Updated the severity of %s files", updated_files)
+    # A rerun after a crash queues the same emails again, which the
+    # outbox ignores through their idempotency keys
+    sends: list[Future[Counter]] = []
+    with (
+        nullcontext(executor)
+        if executor
+        else ThreadPoolExecutor(max_workers=get_outbox_workers())
+    ) as sender:
+
+        def send_batch(emails: list[OutboxEmail]) -> None:
+            # The owners of a committed batch are notified while the next
+            # batch is being queued
+            sends.extend(
+                sender.submit(
+                    send_recipient_emails,
+                    credentials,
+                    connection_pool,
+                    email.recipient,
+                )
+                for email in emails
+            )
+
+        with METRICS.time(
+            "stage_seconds", command="process-forms", stage="queue_emails"
+        ):
+            queued = add_outbox_emails(
+                connection_pool,
+                (
+                    change_permission_email(owner, files)
+                    for owner, files in iter_public_files_by_owner(
+                        connection_pool
+                    )
+                ),
+                on_commit=send_batch,
+            )
+        LOGGER.info("Queued %s emails", queued)
+        with METRICS.time(
+            "stage_seconds", command="process-forms", stage="notify_owners"
+        ):
+            emails = sum((send.result() for send in sends), Counter())
+    if emails:
+        LOGGER.warning("Permission emails sent: %s", dict(emails))
+    # Emails whose send failed or was skipped, and those of earlier runs
+    send_queued_emails(connection_pool, credentials, executor)
+
+
+def run(args: argparse.Namespace) -> None:
+    del args
+    process_results()
@@ -0,0 +1,51 @@
+import argparse
+import logging
+from src.credentials import (
+    get_remediation_credentials,
+    get_user_credentials,
+)
+from src.database import (
+    get_connection_pool,
+)
+from src.files import (
+    iter_public_files_by_owner,
+)
+from src.remediation import (
+    remediate_files,
+)
+from src.services import (
+    get_service,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+
+def remediate_public_files(dry_run: bool = False) -> None:
+    connection_pool = get_connection_pool()
+    # A dry run only reads the permissions, which the read-only scope of
+    # the user credentials allows
+    credentials = (
+        get_user_credentials() if dry_run else get_remediation_credentials()
+    )
+    if not credentials:
+        LOGGER.error("Credentials not found")
+        return
+
+    service = get_service("drive", "v3", credentials)
+    public_files = (
+        file
+        for _, files in iter_public_files_by_owner(connection_pool)
+        for file in files
+    )
+    summary = remediate_files(
+        service, connection_pool, public_files, dry_run=dry_run
+    )
+    LOGGER.warning(
+        "Remediation%s finished: %s",
+        " (dry run)" if dry_run else "",
+        dict(summary),
+    )
+
+
+def run(args: argparse.Namespace) -> None:
+    remediate_public_files(dry_run=args.dry_run)
@@ -0,0 +1,279 @@
+import argparse
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+from googleapiclient.errors import (
+    HttpError,
+)
+import logging
+from src.changes import (
+    EXPIRED_TOKEN_STATUSES,
+    REJECTED_PAGE_TOKEN_STATUSES,
+    SCAN_CHANGES,
+    SCAN_FILES,
+    ScanCheckpoint,
+    clear_scan_checkpoint,
+    complete_scan,
+    get_changes_pages,
+    get_changes_token,
+    get_scan_checkpoint,
+    get_start_page_token,
+    save_scan_checkpoint,
+    split_changes,
+)
+from src.credentials import (
+    get_user_credentials,
+)
+from src.database import (
+    ConnectionPool,
+    get_connection_pool,
+)
+from src.files import (
+    add_file_records,
+    build_file,
+    delete_file_records,
+)
+from src.metrics import (
+    METRICS,
+)
+from src.services import (
+    get_service,
+)
+from src.users import (
+    create_users,
+    get_user_emails,
+    get_user_files_pages,
+)
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    TypeVar,
+)
+
+LOGGER = logging.getLogger("challeng")
+T = TypeVar("T")
+
+
+def _store_files_page(
+    pool: ConnectionPool,
+    files_raw: list[dict[str, Any]],
+    known_users: set[str],
+) -> int:
+    files = [build_file(item) for item in files_raw]
+    with METRICS.time("stage_seconds", command="scan", stage="store_page"):
+        # Owners must exist before their files because of the foreign key
+        new_users = create_users(pool, files_raw, known_users)
+        affected_rows = add_file_records(pool, files)
+    if new_users:
+        LOGGER.info("Stored %s new users", new_users)
+    LOGGER.info(
+        "Stored %s files (%s rows affected)", len(files), affected_rows
+    )
+    return len(files)
+
+
+def _store_changes_page(
+    pool: ConnectionPool,
+    changes: list[dict[str, Any]],
+    known_users: set[str],
+) -> int:
+    changed, removed = split_changes(changes)
+    if changed:
+        _store_files_page(pool, changed, known_users)
+    if removed:
+        with METRICS.time(
+            "stage_seconds", command="scan", stage="remove_files"
+        ):
+            delete_file_records(pool, removed)
+        LOGGER.info("Removed %s files", len(removed))
+    return len(changed) + len(removed)
+
+
+def _write_pages(pages: Iterable[T], store: Callable[[T], int]) -> int:
+    # A single writer thread stores one page while the next one is being
+    # fetched, so at most two pages are alive at any time.
+    total = 0
+    iterator = iter(pages)
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        pending: Future[int] | None = None
+        while True:
+            with METRICS.time(
+                "stage_seconds", command="scan", stage="fetch_page"
+            ):
+                page = next(iterator, None)
+            if page is None:
+                break
+            if pending is not None:
+                total += pending.result()
+            pending = writer.submit(store, page)
+        if pending is not None:
+            total += pending.result()
+    return total
+
+
+def _checkpointed(
+    pool: ConnectionPool,
+    checkpoint: ScanCheckpoint,
+    store: Callable[[list[dict[str, Any]]], int],
+) -> Callable[[tuple[list[dict[str, Any]], str | None]], int]:
+    """
+    Wraps a page store so that the checkpoint moves to the next page once
+    the page is committed. Pages are stored in order by a single writer.
+    """
+
+    def store_page(page: tuple[list[dict[str, Any]], str | None]) -> int:
+        nonlocal checkpoint
+        items, next_page_token = page
+        stored = store(items)
+        checkpoint = checkpoint._replace(
+            page_token=next_page_token,
+            pages=checkpoint.pages + 1,
+            items=checkpoint.items + stored,
+        )
+        # The last page is committed together with the changes token
+        if next_page_token is not None:
+            with pool.get_connection() as connection:
+                save_scan_checkpoint(connection, checkpoint)
+        return stored
+
+    return store_page
+
+
+def _scan_all_files(
+    pool: ConnectionPool,
+    service: Any,
+    known_users: set[str],
+    checkpoint: ScanCheckpoint | None = None,
+) -> str:
+    if checkpoint is None:
+        # Take the token before listing so that changes made during the
+        # scan are picked up by the next incremental run
+        checkpoint = ScanCheckpoint(
+            SCAN_FILES, None, get_start_page_token(service)
+        )
+    total_files = _write_pages(
+        get_user_files_pages(service, page_token=checkpoint.page_token),
+        _checkpointed(
+            pool,
+            checkpoint,
+            lambda files_raw: _store_files_page(pool, files_raw, known_users),
+        ),
+    )
+    LOGGER.info("Scanned %s files", checkpoint.items + total_files)
+    return checkpoint.start_page_token
+
+
+def _scan_changes(
+    pool: ConnectionPool,
+    service: Any,
+    checkpoint: ScanCheckpoint,
+    known_users: set[str],
+) -> str | None:
+    new_start_page_token = None
+
+    def changes_pages() -> Iterator[tuple[list[dict[str, Any]], str | None]]:
+        nonlocal new_start_page_token
+        for (
+            changes,
+            next_page_token,
+            new_start_page_token,
+        ) in get_changes_pages(service, checkpoint.page_token):
+            yield changes, next_page_token
+
+    total_changes = _write_pages(
+        changes_pages(),
+        _checkpointed(
+            pool,
+            checkpoint,
+            lambda changes: _store_changes_page(pool, changes, known_users),
+        ),
+    )
+    LOGGER.info("Applied %s changes", checkpoint.items + total_changes)
+    return new_start_page_token
+
+
+def scan_user_files(
+    full_scan: bool = False,
+    connection_pool: ConnectionPool | None = None,
+    resume: bool = False,
+    *,
+    warn_no_checkpoint: bool = True,
+) -> None:
+    """
+    Stores the user's files, only the changes since the last scan unless
+    full_scan is set. Every committed page is checkpointed, and with
+    resume an interrupted scan continues from its last checkpoint. The
+    daemon always resumes and sets warn_no_checkpoint to False, since
+    finding nothing to resume is its normal case.
+    """
+    pool = connection_pool or get_connection_pool()
+    credentials = get_user_credentials()
+
+    if not credentials:
+        LOGGER.error("Credentials not found")
+        return
+    try:
+        service = get_service("drive", "v3", credentials)
+
+        with pool.get_connection() as connection:
+            checkpoint = get_scan_checkpoint(connection) if resume else None
+            if checkpoint is None:
+                if resume and warn_no_checkpoint:
+                    LOGGER.warning("No scan to resume, starting a new one")
+                # A new scan replaces the one that was interrupted
+                clear_scan_checkpoint(connection)
+                page_token = (
+                    None if full_scan else get_changes_token(connection)
+                )
+                if page_token:
+                    checkpoint = ScanCheckpoint(SCAN_CHANGES, page_token, None)
+            else:
+                LOGGER.warning(
+                    "Resuming the %s scan after %s pages and %s items",
+                    checkpoint.kind,
+                    checkpoint.pages,
+                    checkpoint.items,
+                )
+            known_users = get_user_emails(connection)
+
+        new_page_token = None
+        if checkpoint and checkpoint.kind == SCAN_FILES:
+            try:
+                new_page_token = _scan_all_files(
+                    pool, service, known_users, checkpoint
+                )
+            except HttpError as error:
+                if error.resp.status not in REJECTED_PAGE_TOKEN_STATUSES:
+                    raise
+                # Resuming from it again would fail the same way
+                LOGGER.warning(
+                    "The saved scan page was rejected, running a new scan"
+                )
+                with pool.get_connection() as connection:
+                    clear_scan_checkpoint(connection)
+        elif checkpoint:
+            try:
+                new_page_token = _scan_changes(
+                    pool, service, checkpoint, known_users
+                )
+            except HttpError as error:
+                if error.resp.status not in EXPIRED_TOKEN_STATUSES:
+                    raise
+                LOGGER.warning("Changes token expired, running a full scan")
+        if not new_page_token:
+            new_page_token = _scan_all_files(pool, service, known_users)
+
+        with pool.get_connection() as connection:
+            complete_scan(connection, new_page_token)
+
+    except HttpError as error:
+        # Raised again so that the daemon counts the run as failed
+        LOGGER.error("Failed to scan files: %s", error)
+        raise
+
+
+def run(args: argparse.Namespace) -> None:
+    scan_user_files(full_scan=args.full_scan, resume=args.resume)
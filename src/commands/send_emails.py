@@ -0,0 +1,37 @@
+import argparse
+from concurrent.futures import (
+    Executor,
+)
+from google.oauth2.credentials import (
+    Credentials,
+)
+import logging
+from src.credentials import (
+    get_user_credentials,
+)
+from src.database import (
+    ConnectionPool,
+    get_connection_pool,
+)
+from src.outbox import (
+    drain_outbox,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+
+def send_queued_emails(
+    connection_pool: ConnectionPool | None = None,
+    credentials: Credentials | None = None,
+    executor: Executor | None = None,
+) -> None:
+    connection_pool = connection_pool or get_connection_pool()
+    credentials = credentials or get_user_credentials()
+    summary = drain_outbox(credentials, connection_pool, executor=executor)
+    if summary:
+        LOGGER.warning("Email outbox drained: %s", dict(summary))
+
+
+def run(args: argparse.Namespace) -> None:
+    del args
+    send_queued_emails()
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+from concurrent.futures import (
+    Executor,
+)
+import logging
+import os
+from src.commands.send_emails import (
+    send_queued_emails,
+)
+from src.credentials import (
+    get_user_credentials,
+)
+from src.database import (
+    ConnectionPool,
+    get_connection_pool,
+)
+from src.email_manage import (
+    get_me,
+)
+from src.forms import (
+    get_forms_concurrency,
+    get_pending_files,
+)
+from src.pipeline import (
+    send_forms_pipeline,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+
+def send_severity_forms(
+    connection_pool: ConnectionPool | None = None,
+    executor: Executor | None = None,
+) -> None:
+    connection_pool = connection_pool or get_connection_pool()
+    credentials = get_user_credentials()
+    user_me = get_me(credentials)
+    # FORMS_ALLOWED_USERS restricts the recipients, empty means everybody
+    allowed_users = os.environ.get("FORMS_ALLOWED_USERS")
+    with connection_pool.get_connection() as connection:
+        # Only the users with pending files get a form
+        pending_files = get_pending_files(
+            connection, allowed_users.split(",") if allowed_users else None
+        )
+    sent_forms, emails = asyncio.run(
+        send_forms_pipeline(
+            credentials,
+            connection_pool,
+            pending_files,
+            me_email=user_me["emailAddress"],
+            concurrency=get_forms_concurrency(),
+            executor=executor,
+        )
+    )
+    LOGGER.info("Created %s forms", sent_forms)
+    if emails:
+        LOGGER.warning("Form emails sent: %s", dict(emails))
+    # Emails whose send failed or was skipped, and those of earlier runs
+    send_queued_emails(connection_pool, credentials, executor)
+
+
+def run(args: argparse.Namespace) -> None:
+    del args
+    send_severity_forms()
@@ -0,0 +1,146 @@
+from datetime import (
+    datetime,
+    timedelta,
+)
+from google.auth.transport.requests import (
+    Request,
+)
+from google.oauth2.credentials import (
+    Credentials,
+)
+from google_auth_oauthlib.flow import (
+    InstalledAppFlow,
+)
+import os
+from pathlib import (
+    Path,
+)
+import tempfile
+import threading
+
+# If modifying these scopes, delete the file token.json.
+SCOPES = [
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+    # "https://www.googleapis.com/auth/drive",
+    # "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/forms.body",
+    "https://www.googleapis.com/auth/gmail.compose",
+    "https://www.googleapis.com/auth/gmail.send",
+    "https://www.googleapis.com/auth/forms.responses.readonly",
+]
+TOKEN_PATH = Path("token.json")
+# Removing public permissions needs write access to Drive, which only
+# --remediate asks for, with a token of its own
+REMEDIATION_SCOPES = ["https://www.googleapis.com/auth/drive"]
+REMEDIATION_TOKEN_PATH = Path("token_remediation.json")
+CLIENT_SECRETS_PATH = Path("credentials.json")
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class CredentialProvider:
+    """
+    Loads the user credentials once and shares them between threads,
+    refreshing the token before it expires.
+    """
+
+    def __init__(
+        self,
+        token_path: Path = TOKEN_PATH,
+        scopes: list[str] | None = None,
+        refresh_margin: timedelta = REFRESH_MARGIN,
+    ) -> None:
+        self.token_path = token_path
+        self.scopes = scopes or SCOPES
+        self.refresh_margin = refresh_margin
+        self._credentials: Credentials | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Credentials:
+        with self._lock:
+            if self._credentials is None:
+                self._credentials = self._load()
+            elif self._expires_soon(self._credentials):
+                self._refresh(self._credentials)
+            return self._credentials
+
+    def _expires_soon(self, credentials: Credentials) -> bool:
+        if not credentials.valid:
+            return True
+        # google-auth keeps the expiry as a naive UTC datetime
+        return credentials.expiry is not None and (
+            credentials.expiry - self.refresh_margin <= datetime.utcnow()
+        )
+
+    def _load(self) -> Credentials:
+        # The file token.json stores the user's access and refresh tokens,
+        # and is created automatically when the authorization flow
+        # completes for the first time.
+        credentials = None
+        if self.token_path.exists():
+            credentials = Credentials.from_authorized_user_file(
+                str(self.token_path), self.scopes
+            )
+        if credentials and not self._expires_soon(credentials):
+            return credentials
+        if credentials and credentials.refresh_token:
+            self._refresh(credentials)
+            return credentials
+
+        # If there are no (valid) credentials available, let the user log in.
+        flow = InstalledAppFlow.from_client_secrets_file(
+            CLIENT_SECRETS_PATH,
+            self.scopes,
+        )
+        credentials = flow.run_local_server(
+            port=8081, bind_addr="0.0.0.0", open_browser=False
+        )
+        self._save(credentials)
+        return credentials
+
+    def _refresh(self, credentials: Credentials) -> None:
+        # Refreshing mutates the shared object, so API clients built with it
+        # keep working with the new token
+        credentials.refresh(Request())
+        self._save(credentials)
+
+    def _save(self, credentials: Credentials) -> None:
+        directory = self.token_path.parent
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, delete=False, encoding="utf-8"
+        ) as token:
+            token.write(credentials.to_json())
+        os.replace(token.name, self.token_path)
+
+
+_PROVIDER: CredentialProvider | None = None
+_REMEDIATION_PROVIDER: CredentialProvider | None = None
+_PROVIDER_LOCK = threading.Lock()
+
+
+def get_credential_provider() -> CredentialProvider:
+    global _PROVIDER  # pylint: disable=global-statement
+    with _PROVIDER_LOCK:
+        if _PROVIDER is None:
+            _PROVIDER = CredentialProvider()
+        return _PROVIDER
+
+
+def set_credential_provider(provider: CredentialProvider) -> None:
+    global _PROVIDER  # pylint: disable=global-statement
+    with _PROVIDER_LOCK:
+        _PROVIDER = provider
+
+
+def get_user_credentials() -> Credentials:
+    return get_credential_provider().get()
+
+
+def get_remediation_credentials() -> Credentials:
+    global _REMEDIATION_PROVIDER  # pylint: disable=global-statement
+    with _PROVIDER_LOCK:
+        if _REMEDIATION_PROVIDER is None:
+            _REMEDIATION_PROVIDER = CredentialProvider(
+                REMEDIATION_TOKEN_PATH, REMEDIATION_SCOPES
+            )
+        provider = _REMEDIATION_PROVIDER
+    return provider.get()
@@ -0,0 +1,237 @@
+from datetime import (
+    datetime,
+    timezone,
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+import json
+import logging
+import os
+import queue
+import signal
+from src.metrics import (
+    METRICS,
+)
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+# Seconds between two runs of every job, 0 disables the job
+DEFAULT_INTERVALS = {
+    "scan": 3600,
+    "send-forms": 86400,
+    "process-forms": 300,
+    "send-emails": 600,
+}
+DEFAULT_STATUS_HOST = "127.0.0.1"
+DEFAULT_STATUS_PORT = 8090
+SCHEDULER_TICK = 1.0
+
+
+def get_job_interval(name: str) -> float:
+    variable = f"DAEMON_{name.upper().replace('-', '_')}_INTERVAL"
+    return float(os.environ.get(variable, DEFAULT_INTERVALS[name]))
+
+
+class Job:
+    def __init__(
+        self, name: str, interval: float, run: Callable[[], None]
+    ) -> None:
+        self.name = name
+        self.interval = interval
+        self.run = run
+        self.next_run = time.monotonic()
+        # Queued or running, a job is never queued twice
+        self.pending = False
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started: datetime | None = None
+        self.last_duration: float | None = None
+        self.last_error: str | None = None
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": (
+                self.last_started.isoformat() if self.last_started else None
+            ),
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "next_run_in": round(max(self.next_run - time.monotonic(), 0), 1),
+        }
+
+
+class Daemon:
+    """
+    Runs every job on its interval in a fixed set of worker threads, so the
+    API clients they build stay warm between runs. A run that is due while
+    the previous one is still queued or running is skipped instead of
+    piling up.
+    """
+
+    def __init__(self, jobs: list[Job], workers: int = 1) -> None:
+        self.jobs = jobs
+        self.workers = workers
+        self._queue: queue.Queue[Job | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self.started_at = datetime.now(timezone.utc)
+
+    def _schedule(self) -> None:
+        while not self._stop.wait(SCHEDULER_TICK):
+            now = time.monotonic()
+            for job in self.jobs:
+                if job.next_run > now:
+                    continue
+                job.next_run = now + job.interval
+                with self._lock:
+                    if job.pending:
+                        job.skipped += 1
+                        LOGGER.warning(
+                            "Skipping %s, the previous run is not over",
+                            job.name,
+                        )
+                        continue
+                    job.pending = True
+                self._queue.put(job)
+
+    def _work(self) -> None:
+        while (job := self._queue.get()) is not None:
+            with self._lock:
+                job.running = True
+                job.last_started = datetime.now(timezone.utc)
+            start = time.perf_counter()
+            error = None
+            try:
+                with METRICS.time(
+                    "stage_seconds", command=job.name, stage="total"
+                ):
+                    job.run()
+            except Exception as exc:  # pylint: disable=broad-except
+                LOGGER.error("Daemon job %s failed: %s", job.name, exc)
+                error = str(exc)
+            with self._lock:
+                job.last_duration = round(time.perf_counter() - start, 3)
+                job.last_error = error
+                job.runs += 1
+                job.failures += error is not None
+                job.running = job.pending = False
+            METRICS.inc("daemon_runs", command=job.name, ok=str(not error))
+
+    def status(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at.isoformat(),
+                "queue_depth": self._queue.qsize(),
+                "jobs": {job.name: job.status() for job in self.jobs},
+            }
+
+    def start(self) -> None:
+        self._threads = [
+            threading.Thread(target=self._work, name=f"daemon-worker-{index}")
+            for index in range(self.workers)
+        ]
+        self._threads.append(
+            threading.Thread(target=self._schedule, name="daemon-scheduler")
+        )
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops scheduling and waits for the runs in progress to finish.
+        """
+        self._stop.set()
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def _status_handler(daemon: Daemon) -> type[BaseHTTPRequestHandler]:
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            if self.path == "/health":
+                self._reply(200, "application/json", '{"status": "ok"}')
+            elif self.path == "/status":
+                self._reply(
+                    200, "application/json", json.dumps(daemon.status())
+                )
+            elif self.path == "/metrics":
+                self._reply(
+                    200,
+                    "application/openmetrics-text; version=1.0.0",
+                    METRICS.render(),
+                )
+            else:
+                self._reply(404, "text/plain", "Not found")
+
+        def _reply(self, status: int, content_type: str, body: str) -> None:
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    return StatusHandler
+
+
+def run_daemon(jobs: dict[str, Callable[[], None]]) -> None:
+    """
+    Runs the jobs until SIGINT or SIGTERM, serving /health, /status and
+    /metrics on DAEMON_STATUS_HOST:DAEMON_STATUS_PORT.
+    """
+    daemon = Daemon(
+        [
+            Job(name, interval, run)
+            for name, run in jobs.items()
+            if (interval := get_job_interval(name)) > 0
+        ],
+        workers=int(os.environ.get("DAEMON_WORKERS", 1)),
+    )
+    server = ThreadingHTTPServer(
+        (
+            os.environ.get("DAEMON_STATUS_HOST", DEFAULT_STATUS_HOST),
+            int(os.environ.get("DAEMON_STATUS_PORT", DEFAULT_STATUS_PORT)),
+        ),
+        _status_handler(daemon),
+    )
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    daemon.start()
+    server_thread = threading.Thread(
+        target=server.serve_forever, name="daemon-status"
+    )
+    server_thread.start()
+    LOGGER.warning(
+        "Daemon running %s, status on port %s",
+        ", ".join(job.name for job in daemon.jobs),
+        server.server_address[1],
+    )
+    while not stopping.wait(SCHEDULER_TICK):
+        pass
+    LOGGER.warning("Stopping the daemon")
+    server.shutdown()
+    server_thread.join()
+    server.server_close()
+    daemon.stop()
@@ -2,11 +2,204 @@ import mysql.connector
 from mysql.connector.connection import (
     MySQLConnection,
 )
+from mysql.connector.errors import (
+    PoolError,
+)
 from mysql.connector.pooling import (
+    CNX_POOL_MAXSIZE,
     MySQLConnectionPool,
 )
 import os
 import os.path
+import re
+from src.metrics import (
+    METRICS,
+    MetricsRegistry,
+)
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+)
+import weakref
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_POOL_TIMEOUT = 30.0
+# MySQL closes connections idle for wait_timeout, eight hours by default
+DEFAULT_POOL_MAX_AGE = 3600.0
+STATEMENT_TABLE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+`?(\w+)", re.IGNORECASE
+)
+
+
+_POOLS: list["ConnectionPool"] = []
+_POOLS_LOCK = threading.Lock()
+
+
+def statement_label(query: str) -> str:
+    """
+    Returns the kind of statement and the first table it touches, which is
+    how queries are grouped in the metrics.
+    """
+    operation = query.split(None, 1)[0].upper() if query.strip() else ""
+    match = STATEMENT_TABLE.search(query)
+    return f"{operation} {match.group(1)}" if match else operation
+
+
+class MeteredCursor:
+    def __init__(self, cursor: Any) -> None:
+        self._cursor = cursor
+
+    def execute(self, operation: str, *args: Any, **kwargs: Any) -> Any:
+        with METRICS.time(
+            "db_query_seconds", statement=statement_label(operation)
+        ):
+            return self._cursor.execute(operation, *args, **kwargs)
+
+    def executemany(self, operation: str, *args: Any, **kwargs: Any) -> Any:
+        with METRICS.time(
+            "db_query_seconds", statement=statement_label(operation)
+        ):
+            return self._cursor.executemany(operation, *args, **kwargs)
+
+    def __iter__(self) -> Any:
+        return iter(self._cursor)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+class MeteredConnection:
+    def __init__(
+        self, connection: Any, on_close: Callable[[], None] | None = None
+    ) -> None:
+        self._connection = connection
+        self._on_close = on_close
+
+    def cursor(self, *args: Any, **kwargs: Any) -> MeteredCursor:
+        return MeteredCursor(self._connection.cursor(*args, **kwargs))
+
+    def close(self) -> None:
+        on_close, self._on_close = self._on_close, None
+        try:
+            self._connection.close()
+        finally:
+            if on_close is not None:
+                on_close()
+
+    def __enter__(self) -> "MeteredConnection":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+
+class ConnectionPool:
+    """
+    Wraps MySQLConnectionPool so that checking out a connection waits up
+    to `timeout` seconds for one to be returned instead of failing as soon
+    as the pool is exhausted. Connections older than `max_age` seconds are
+    reopened on checkout; the pool itself already reconnects the ones that
+    do not answer a ping. The time spent waiting for a connection and
+    every statement run on it are recorded in METRICS.
+    """
+
+    def __init__(
+        self,
+        pool: MySQLConnectionPool,
+        *,
+        timeout: float = DEFAULT_POOL_TIMEOUT,
+        max_age: float = DEFAULT_POOL_MAX_AGE,
+        name: str = "0",
+    ) -> None:
+        self._pool = pool
+        self.name = name
+        self.timeout = timeout
+        self.max_age = max_age
+        self._slots = threading.BoundedSemaphore(pool.pool_size)
+        self._lock = threading.Lock()
+        self._opened_at: weakref.WeakKeyDictionary[Any, float] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._stats = {
+            "checkouts": 0,
+            "waited_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "timeouts": 0,
+            "recycled": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+        }
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool.pool_size
+
+    def get_connection(
+        self, timeout: float | None = None
+    ) -> MeteredConnection:
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        acquired = self._slots.acquire(timeout=timeout)
+        waited = time.perf_counter() - start
+        METRICS.observe("db_pool_wait_seconds", waited)
+        if not acquired:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            METRICS.inc("db_pool_timeouts", pool=self.name)
+            raise PoolError(
+                f"No connection was returned to the pool in {timeout}s"
+            )
+        try:
+            connection = self._pool.get_connection()
+            self._recycle_if_old(connection)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            stats = self._stats
+            stats["checkouts"] += 1
+            stats["waited_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            stats["in_use"] += 1
+            stats["peak_in_use"] = max(stats["peak_in_use"], stats["in_use"])
+        return MeteredConnection(connection, on_close=self._release)
+
+    def _recycle_if_old(self, connection: Any) -> None:
+        # The pooled wrapper is new on every checkout, the connection under
+        # it is the one that lives in the pool
+        # pylint: disable=protected-access
+        raw = getattr(connection, "_cnx", connection)
+        now = time.monotonic()
+        opened_at = self._opened_at.setdefault(raw, now)
+        if self.max_age and now - opened_at > self.max_age:
+            try:
+                connection.reconnect()
+            except mysql.connector.Error:
+                connection.close()
+                raise
+            self._opened_at[raw] = time.monotonic()
+            with self._lock:
+                self._stats["recycled"] += 1
+            METRICS.inc("db_pool_recycled", pool=self.name)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._stats["in_use"] -= 1
+        self._slots.release()
+
+    def get_stats(self) -> dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["size"] = self.pool_size
+        stats["utilisation"] = round(stats["peak_in_use"] / self.pool_size, 2)
+        stats["waited_seconds"] = round(stats["waited_seconds"], 3)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+        return stats
 
 
 def get_connection() -> MySQLConnection:
@@ -19,8 +212,23 @@ def get_connection() -> MySQLConnection:
     )
 
 
-def get_connection_pool(pool_size: int | None = None) -> MySQLConnectionPool:
-    pool_size = pool_size or (os.cpu_count() or 8) + 2
+def get_pool_size() -> int:
+    """
+    One connection for every worker of the default ThreadPoolExecutor or
+    of the forms pipeline, whichever is larger, plus the one the command
+    holds itself.
+    """
+    if "DB_POOL_SIZE" in os.environ:
+        return int(os.environ["DB_POOL_SIZE"])
+    workers = max(
+        min(32, (os.cpu_count() or 1) + 4),
+        int(os.environ.get("FORMS_MAX_CONCURRENCY", 0)),
+    )
+    return min(CNX_POOL_MAXSIZE, workers + 1)
+
+
+def get_connection_pool(pool_size: int | None = None) -> ConnectionPool:
+    pool_size = pool_size or get_pool_size()
     dbconfig = {
         "host": os.environ["MYSQL_HOST"],
         "user": os.environ["MYSQL_USER"],
@@ -29,7 +237,44 @@ def get_connection_pool(pool_size: int | None = None) -> MySQLConnectionPool:
         "port":os.environ["MYSQL_PORT"]
     }
 
-    # Create a connection pool with 5 connections
-    return MySQLConnectionPool(
-        pool_name="concurrent", pool_size=pool_size, **dbconfig
-    )
+    with _POOLS_LOCK:
+        pool = ConnectionPool(
+            MySQLConnectionPool(
+                pool_name="concurrent", pool_size=pool_size, **dbconfig
+            ),
+            timeout=float(
+                os.environ.get("DB_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT)
+            ),
+            max_age=float(
+                os.environ.get("DB_POOL_MAX_AGE", DEFAULT_POOL_MAX_AGE)
+            ),
+            name=str(len(_POOLS)),
+        )
+        _POOLS.append(pool)
+    return pool
+
+
+def get_pool_stats() -> list[dict[str, float]]:
+    with _POOLS_LOCK:
+        return [pool.get_stats() for pool in _POOLS]
+
+
+def _collect_pool_stats(metrics: MetricsRegistry) -> None:
+    with _POOLS_LOCK:
+        pools = list(_POOLS)
+    for pool in pools:
+        stats = pool.get_stats()
+        for stat in ("size", "in_use", "peak_in_use", "utilisation"):
+            metrics.set(f"db_pool_{stat}", stats[stat], pool=pool.name)
+
+
+METRICS.add_collector(_collect_pool_stats)
+
+
+def get_batch_size() -> int:
+    return int(os.environ.get("DB_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+
+
+def multi_row_placeholders(rows: int, columns: int) -> str:
+    row = f"({', '.join(['%s'] * columns)})"
+    return ", ".join([row] * rows)
@@ -5,90 +5,84 @@ from email.message import (
 from google.oauth2.credentials import (
     Credentials,
 )
-from googleapiclient.discovery import (
-    build,
+import logging
+from src.rate_limit import (
+    execute_request,
 )
-from googleapiclient.errors import (
-    HttpError,
+from src.services import (
+    get_service,
 )
 from typing import (
     Any,
 )
 
+LOGGER = logging.getLogger("challeng")
 
-def send_form_email(credentials: Credentials, user_to: str, form_link: str):
-    try:
-        # create gmail api client
-        service = build("gmail", "v1", credentials=credentials)
 
-        message = EmailMessage()
-
-        message.set_content(f"Encuesta: {form_link}")
-
-        message["To"] = user_to
-        message["From"] = "gduser2@workspacesamples.dev"
-        message[
-            "Subject"
-        ] = f"Encuesta para Determinar la Importancia de Archivos: Por favor, Participa"
+SENDER = "gduser2@workspacesamples.dev"
+FORM_SUBJECT = (
+    "Encuesta para Determinar la Importancia de Archivos: Por favor, Participa"
+)
+CHANGE_PERMISSION_SUBJECT = (
+    "Actualizar configuración de privacidad de archivos"
+)
+DIGEST_SUBJECT = "Novedades sobre sus archivos de Google Drive"
 
-        # encoded message
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
 
-        create_message = {"raw": encoded_message}
-        # pylint: disable=E1101
-        send_message = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
+def form_body(form_link: str) -> str:
+    return f"Encuesta: {form_link}"
 
-        return send_message
 
-    except HttpError as error:
-        print(f"An error occurred: {error}")
+def change_permission_body(files: list[dict[str, str]]) -> str:
+    files_string = [
+        f'{file["file_name"]} {file["file_url"]}' for file in files
+    ]
+    return (
+        "A continuación, se enumeran los siguientes archivos públicos que, debido a su nivel de criticidad, es esencial que cambie los permisos a privados.\n"
+        + "\n".join(files_string)
+    )
 
 
-def send_change_permission_email(
-    credentials: Credentials, user_to: str, files: list[dict[str, str]]
-):
-    try:
-        # create gmail api client
-        service = build("gmail", "v1", credentials=credentials)
+def compile_template(subject: str) -> bytes:
+    """
+    Renders once the headers that every message with this subject shares,
+    so render_message only has to add the recipient and the body.
+    """
+    message = EmailMessage()
+    message["From"] = SENDER
+    message["Subject"] = subject
+    message.set_content("", cte="base64")
+    headers, _ = message.as_bytes().split(b"\n\n", 1)
+    return headers + b"\n"
 
-        message = EmailMessage()
-        files_string = [
-            f'{file["file_name"]} {file["file_url"]}' for file in files
-        ]
-        message.set_content(
-            "A continuación, se enumeran los siguientes archivos públicos que, debido a su nivel de criticidad, es esencial que cambie los permisos a privados.\n"
-            + "\n".join(files_string)
-        )
 
-        message["To"] = user_to
-        message["From"] = "gduser2@workspacesamples.dev"
-        message[
-            "Subject"
-        ] = "Actualizar configuración de privacidad de archivos"
+def render_message(template: bytes, user_to: str, body: str) -> bytes:
+    return (
+        template
+        + f"To: {user_to}\n\n".encode()
+        + base64.encodebytes(body.encode("utf-8"))
+    )
 
-        # encoded message
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
 
-        create_message = {"raw": encoded_message}
-        # pylint: disable=E1101
-        send_message = (
-            service.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
+def send_raw_message(credentials: Credentials, raw_message: bytes) -> Any:
+    """
+    Sends an RFC 2822 message through the Gmail API, raising HttpError when
+    Gmail rejects it after the retries of execute_request.
+    """
+    # create gmail api client
+    service = get_service("gmail", "v1", credentials)
 
-        return send_message
+    # encoded message
+    encoded_message = base64.urlsafe_b64encode(raw_message).decode()
 
-    except HttpError as error:
-        print(f"An error occurred: {error}")
+    create_message = {"raw": encoded_message}
+    # pylint: disable=E1101
+    return execute_request(
+        service.users().messages().send(userId="me", body=create_message),
+        "gmail",
+    )
 
 
 def get_me(credentials: Any) -> dict[str, str]:
-    service = build("gmail", "v1", credentials=credentials)
-    return service.users().getProfile(userId="me").execute()
+    service = get_service("gmail", "v1", credentials)
+    return execute_request(service.users().getProfile(userId="me"), "gmail")
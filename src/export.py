@@ -0,0 +1,193 @@
+from contextlib import (
+    suppress,
+)
+import csv
+import logging
+import mysql.connector
+from pathlib import (
+    Path,
+)
+from src.database import (
+    ConnectionPool,
+)
+import sys
+from typing import (
+    Any,
+    Iterator,
+    TextIO,
+)
+
+try:
+    import pyarrow
+    from pyarrow import (
+        parquet,
+    )
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+LOGGER = logging.getLogger("challeng")
+
+EXPORT_FORMATS = ("csv", "parquet")
+DEFAULT_EXPORT_CHUNK_SIZE = 10000
+EXPORT_COLUMNS = (
+    "file_id",
+    "file_name",
+    "file_extension",
+    "file_url",
+    "file_owner",
+    "owner_name",
+    "file_is_public",
+    "severity",
+    "remediation_status",
+    "form_id",
+    "form_status",
+)
+FORM_STATUS_PENDING = "pending"
+FORM_STATUS_SENT = "sent"
+FORM_STATUS_ANSWERED = "answered"
+
+
+def iter_inventory(
+    connection_pool: ConnectionPool,
+    *,
+    severities: tuple[str, ...] = (),
+    owner: str | None = None,
+    is_public: bool | None = None,
+    chunk_size: int = DEFAULT_EXPORT_CHUNK_SIZE,
+) -> Iterator[list[tuple[Any, ...]]]:
+    """
+    Yields the file inventory in chunks of `chunk_size` rows, in the order
+    of EXPORT_COLUMNS. Rows are read from an unbuffered cursor, so the
+    server streams them and only one chunk is held in memory.
+    """
+    conditions: list[str] = []
+    params: list[Any] = []
+    if severities:
+        conditions.append(
+            f"f.severity IN ({', '.join(['%s'] * len(severities))})"
+        )
+        params.extend(severities)
+    if owner is not None:
+        conditions.append("f.file_owner = %s")
+        params.append(owner)
+    if is_public is not None:
+        conditions.append("f.file_is_public = %s")
+        params.append(is_public)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # The form of every file is looked up through the index of the
+    # google_forms_files foreign key instead of joining the whole table
+    query = f"""
+        SELECT f.file_id, f.file_name, f.file_extension, f.file_url,
+            f.file_owner, u.user_name, f.file_is_public, f.severity,
+            f.remediation_status,
+            (
+                SELECT MAX(gff.form_id) FROM google_forms_files AS gff
+                WHERE gff.file_id = f.file_id
+            ),
+            CASE
+                WHEN f.severity IS NOT NULL THEN '{FORM_STATUS_ANSWERED}'
+                WHEN EXISTS (
+                    SELECT 1 FROM google_forms_files AS gff
+                    WHERE gff.file_id = f.file_id
+                ) THEN '{FORM_STATUS_SENT}'
+                ELSE '{FORM_STATUS_PENDING}'
+            END
+        FROM google_drive_files AS f
+        LEFT JOIN google_drive_users AS u ON u.user_email = f.file_owner
+        {where};
+        """
+    connection = connection_pool.get_connection()
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while rows := cursor.fetchmany(chunk_size):
+            yield rows
+    except mysql.connector.Error as err:
+        LOGGER.error("Failed to export the file inventory: %s", err)
+        raise
+    finally:
+        # Drain the rows left when the caller stops early, the connection
+        # cannot go back to the pool with an unread result
+        with suppress(mysql.connector.Error):
+            cursor.fetchall()
+        cursor.close()
+        connection.close()
+
+
+def _normalize(rows: list[tuple[Any, ...]]) -> list[tuple[Any, ...]]:
+    # MySQL returns BOOLEAN columns as 0 and 1
+    public = EXPORT_COLUMNS.index("file_is_public")
+    return [
+        (
+            *row[:public],
+            None if row[public] is None else bool(row[public]),
+            *row[public + 1 :],
+        )
+        for row in rows
+    ]
+
+
+def write_csv(chunks: Iterator[list[tuple[Any, ...]]], output: TextIO) -> int:
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS)
+    total = 0
+    for rows in chunks:
+        writer.writerows(_normalize(rows))
+        total += len(rows)
+    return total
+
+
+def write_parquet(chunks: Iterator[list[tuple[Any, ...]]], path: Path) -> int:
+    """
+    Writes every chunk as its own row group, so the file is never built
+    in memory as a whole.
+    """
+    if pyarrow is None:
+        raise RuntimeError(
+            "Exporting to Parquet requires pyarrow: pip install pyarrow"
+        )
+    schema = pyarrow.schema(
+        [
+            (
+                (column, pyarrow.bool_())
+                if column == "file_is_public"
+                else (column, pyarrow.string())
+            )
+            for column in EXPORT_COLUMNS
+        ]
+    )
+    total = 0
+    with parquet.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            columns = zip(*_normalize(rows))
+            writer.write_table(
+                pyarrow.Table.from_arrays(
+                    [
+                        pyarrow.array(values, type=field.type)
+                        for values, field in zip(columns, schema)
+                    ],
+                    schema=schema,
+                )
+            )
+            total += len(rows)
+    return total
+
+
+def export_inventory(
+    connection_pool: ConnectionPool,
+    output: str,
+    export_format: str = "csv",
+    **filters: Any,
+) -> int:
+    """
+    Streams the file inventory to `output`, or to stdout when it is - and
+    the format is CSV, and returns the number of exported files. The
+    filters are the keyword arguments of iter_inventory.
+    """
+    chunks = iter_inventory(connection_pool, **filters)
+    if export_format == "parquet":
+        return write_parquet(chunks, Path(output))
+    if output == "-":
+        return write_csv(chunks, sys.stdout)
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        return write_csv(chunks, file)
@@ -1,26 +1,41 @@
 from contextlib import (
     suppress,
 )
+from itertools import (
+    groupby,
+)
 import logging
 import mysql.connector
 from mysql.connector.connection import (
     MySQLConnection,
 )
-from mysql.connector.pooling import (
-    MySQLConnectionPool,
-)
-from requests import (
-    HTTPError,
+from operator import (
+    itemgetter,
 )
 from src.database import (
+    ConnectionPool,
+    get_batch_size,
     get_connection,
+    multi_row_placeholders,
+)
+from src.utils import (
+    batched,
 )
 from typing import (
     Any,
+    Iterable,
+    Iterator,
     NamedTuple,
 )
 
-LOGGER = logging.Logger("challeng")
+LOGGER = logging.getLogger("challeng")
+
+HIGH_SEVERITIES = ("Critico", "Alto")
+
+REMEDIATION_REMOVED = "removed"
+REMEDIATION_NOT_PUBLIC = "not_public"
+REMEDIATION_WOULD_REMOVE = "would_remove"
+REMEDIATION_FAILED = "failed"
 
 
 class File(NamedTuple):
@@ -32,105 +47,220 @@ class File(NamedTuple):
     url: str
 
 
-def add_file_record(connection_pool: MySQLConnectionPool, file: File) -> None:
+def add_file_records(
+    connection_pool: ConnectionPool,
+    files: Iterable[File],
+    batch_size: int | None = None,
+) -> int:
+    """
+    Upserts the files in multi-row statements, one transaction per batch.
+    Files that already exist get their name, url and visibility updated.
+    """
+    batch_size = batch_size or get_batch_size()
+    affected_rows = 0
     connection = connection_pool.get_connection()
     try:
         cursor = connection.cursor()
-        add_file_query = (
-            "INSERT INTO google_drive_files "
-            "(file_id, file_name, file_extension, file_owner, file_is_public, file_url) "
-            "VALUES (%s,%s, %s, %s, %s, %s)"
-        )
-        file_data = (
-            file.id_,
-            file.name,
-            file.extension,
-            file.owner,
-            file.is_public,
-            file.url,
-        )
-        cursor.execute(add_file_query, file_data)
-        connection.commit()
-
+        for batch in batched(files, batch_size):
+            query = (
+                "INSERT INTO google_drive_files "
+                "(file_id, file_name, file_extension, file_owner, file_is_public, file_url) "
+                f"VALUES {multi_row_placeholders(len(batch), 6)} AS new "
+                "ON DUPLICATE KEY UPDATE file_name = new.file_name, "
+                "file_url = new.file_url, file_is_public = new.file_is_public"
+            )
+            values = [
+                value
+                for file in batch
+                for value in (
+                    file.id_,
+                    file.name,
+                    file.extension,
+                    file.owner,
+                    file.is_public,
+                    file.url,
+                )
+            ]
+            try:
+                cursor.execute(query, values)
+                connection.commit()
+            except mysql.connector.Error as err:
+                connection.rollback()
+                LOGGER.error("Failed to add file records: %s", err)
+                raise
+            affected_rows += cursor.rowcount
         cursor.close()
-    except mysql.connector.Error as err:
-        if err.errno not in (1062,):
-            LOGGER.error("Failed to add file record: %s", err)
-    connection.close()
+    finally:
+        connection.close()
+    return affected_rows
 
 
-def set_file_severity(
-    connection_pool: MySQLConnectionPool, question_id: str, new_severity: str
-) -> None:
+def delete_file_records(
+    connection_pool: ConnectionPool,
+    file_ids: Iterable[str],
+    batch_size: int | None = None,
+) -> int:
+    batch_size = batch_size or get_batch_size()
+    deleted_rows = 0
     connection = connection_pool.get_connection()
     try:
         cursor = connection.cursor()
-        query = """
-            UPDATE google_drive_files AS gdf
-            JOIN google_forms_files AS gff ON gdf.file_id = gff.file_id
-            SET gdf.severity = %s
-            WHERE gff.question_id = %s;
-        """
-        values = (new_severity, question_id)
-
-        cursor.execute(query, values)
+        for batch in batched(file_ids, batch_size):
+            placeholders = ", ".join(["%s"] * len(batch))
+            try:
+                # Questions reference the files, so they go first
+                cursor.execute(
+                    "DELETE FROM google_forms_files "
+                    f"WHERE file_id IN ({placeholders})",
+                    batch,
+                )
+                cursor.execute(
+                    "DELETE FROM google_drive_files "
+                    f"WHERE file_id IN ({placeholders})",
+                    batch,
+                )
+                connection.commit()
+            except mysql.connector.Error as err:
+                connection.rollback()
+                LOGGER.error("Failed to delete file records: %s", err)
+                raise
+            deleted_rows += cursor.rowcount
+        cursor.close()
+    finally:
+        connection.close()
+    return deleted_rows
 
-        connection.commit()
 
-        cursor.close()
-    except mysql.connector.Error as err:
-        if err.errno not in (1062,):
+def set_files_severity(
+    connection_pool: ConnectionPool,
+    severities: Iterable[tuple[str, str]],
+    batch_size: int | None = None,
+) -> int:
+    """
+    Sets the severity of the files asked in every (question_id, severity)
+    pair. The pairs are loaded into a temporary table and applied with a
+    single joined UPDATE, all in one transaction.
+    """
+    batch_size = batch_size or get_batch_size()
+    connection = connection_pool.get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "CREATE TEMPORARY TABLE question_severity_staging ("
+            "question_id VARCHAR(15) NOT NULL, "
+            "severity VARCHAR(50) NOT NULL, "
+            "PRIMARY KEY (question_id))"
+        )
+        try:
+            for batch in batched(severities, batch_size):
+                cursor.execute(
+                    "INSERT INTO question_severity_staging "
+                    "(question_id, severity) "
+                    f"VALUES {multi_row_placeholders(len(batch), 2)} AS new "
+                    "ON DUPLICATE KEY UPDATE severity = new.severity",
+                    [value for pair in batch for value in pair],
+                )
+            cursor.execute(
+                """
+                UPDATE google_drive_files AS gdf
+                JOIN google_forms_files AS gff ON gdf.file_id = gff.file_id
+                JOIN question_severity_staging AS qss
+                    ON gff.question_id = qss.question_id
+                SET gdf.severity = qss.severity;
+                """
+            )
+            updated_rows = cursor.rowcount
+            connection.commit()
+        except mysql.connector.Error as err:
+            connection.rollback()
             LOGGER.error("Failed to set file severity: %s", err)
-    connection.close()
+            raise
+        finally:
+            cursor.execute("DROP TEMPORARY TABLE question_severity_staging")
+            cursor.close()
+    finally:
+        connection.close()
+    return updated_rows
 
 
 def file_is_public(permissions: list[dict[str, Any]]) -> bool:
     return any(p["type"] == "anyone" for p in permissions)
 
 
-def remove_public_permissions(service: Any, file_id: str) -> None:
-    file = (
-        service.files()
-        .get(
-            fileId=file_id,
-            fields="id, name, owners, fullFileExtension, originalFilename, permissions",
-        )
-        .execute()
-    )
-    bad_permission = next(
-        (p["id"] for p in file["permissions"] if p["type"] == "anyone"), None
+def build_file(item: dict[str, Any]) -> File:
+    return File(
+        id_=item["id"],
+        name=item["name"],
+        extension=item.get("fullFileExtension", None),
+        owner=item["owners"][0]["emailAddress"],
+        is_public=file_is_public(item.get("permissions", [])),
+        url=item["webViewLink"],
     )
-    if not bad_permission:
-        return
-    try:
-        result = (
-            service.permissions()
-            .delete(fileId=file_id, permissionId=bad_permission)
-            .execute()
-        )
-    except HTTPError as e:
-        LOGGER.exception(e)
-    return result
 
 
-def get_all_pubic_files_by_severity(
-    connection_pool: MySQLConnectionPool, severity: str
+def set_remediation_status(
+    connection_pool: ConnectionPool, statuses: dict[str, str]
 ) -> None:
+    """
+    Stores the remediation outcome of every file. Files whose public
+    permission is gone are no longer marked as public.
+    """
+    files_by_status: dict[str, list[str]] = {}
+    for file_id, status in statuses.items():
+        files_by_status.setdefault(status, []).append(file_id)
+
     connection = connection_pool.get_connection()
-    result = []
     try:
-        cursor = connection.cursor(dictionary=True)
-        query = """
-            SELECT * from google_drive_files where severity = %s AND file_is_public = TRUE;
-            """
-        values = (severity,)
-        cursor.execute(query, values)
+        cursor = connection.cursor()
+        for status, file_ids in files_by_status.items():
+            placeholders = ", ".join(["%s"] * len(file_ids))
+            query = (
+                "UPDATE google_drive_files SET remediation_status = %s, "
+                "file_is_public = file_is_public AND %s "
+                f"WHERE file_id IN ({placeholders})"
+            )
+            still_public = status not in (
+                REMEDIATION_REMOVED,
+                REMEDIATION_NOT_PUBLIC,
+            )
+            cursor.execute(query, (status, still_public, *file_ids))
         connection.commit()
         cursor.close()
     except mysql.connector.Error as err:
-        if err.errno not in (1062,):
-            LOGGER.error("Failed to get all public files by severity: %s", err)
-    with suppress(mysql.connector.errors.InterfaceError):
-        result = cursor.fetchall()
-    connection.close()
-    return result
+        connection.rollback()
+        LOGGER.error("Failed to set remediation status: %s", err)
+    finally:
+        connection.close()
+
+
+def iter_public_files_by_owner(
+    connection_pool: ConnectionPool,
+    severities: tuple[str, ...] = HIGH_SEVERITIES,
+) -> Iterator[tuple[str, list[dict[str, str]]]]:
+    """
+    Yields the public files with the given severities grouped by owner.
+    Rows are read from an unbuffered cursor, so every group is yielded as
+    soon as it is complete instead of after the whole result set.
+    """
+    connection = connection_pool.get_connection()
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    try:
+        placeholders = ", ".join(["%s"] * len(severities))
+        query = f"""
+            SELECT file_id, file_name, file_url, file_owner, severity
+            FROM google_drive_files
+            WHERE severity IN ({placeholders}) AND file_is_public = TRUE
+            ORDER BY file_owner;
+            """
+        cursor.execute(query, severities)
+        for owner, files in groupby(cursor, key=itemgetter("file_owner")):
+            yield owner, list(files)
+    except mysql.connector.Error as err:
+        LOGGER.error("Failed to get public files by severity: %s", err)
+    finally:
+        # Drain the rows left when the caller stops early, the connection
+        # cannot go back to the pool with an unread result
+        with suppress(mysql.connector.Error):
+            cursor.fetchall()
+        cursor.close()
+        connection.close()
@@ -1,58 +1,68 @@
-from apiclient import (
-    discovery,
-)
-from concurrent.futures import (
-    ThreadPoolExecutor,
-)
 from google.oauth2.credentials import (
     Credentials,
 )
-from itertools import (
-    repeat,
-)
 import logging
 import mysql.connector
 from mysql.connector.connection import (
     MySQLConnection,
 )
-from mysql.connector.pooling import (
-    MySQLConnectionPool,
+import os
+from src.database import (
+    ConnectionPool,
+    multi_row_placeholders,
 )
-from os import (
-    cpu_count,
+from src.outbox import (
+    enqueue_emails,
+    form_email,
 )
-import os.path
-from src.database import (
-    get_connection,
-    get_connection_pool,
+from src.rate_limit import (
+    execute_request,
+)
+from src.services import (
+    get_service,
+)
+from src.utils import (
+    batched,
 )
 from typing import (
     Any,
+    Iterable,
 )
 
-DISCOVERY_DOC = "https://forms.googleapis.com/$discovery/rest?version=v1"
-LOGGER = logging.Logger("challeng")
+LOGGER = logging.getLogger("challeng")
 
+FORM_TITLE = "Uso de archivos compartidos"
+DEFAULT_FORM_MAX_QUESTIONS = 100
+DEFAULT_FORMS_CONCURRENCY = 4
 
-def _get_user_files(
-    connection: MySQLConnection, user_email: str
-) -> list[dict[str, str]]:
+
+def get_pending_files(
+    connection: MySQLConnection, user_emails: list[str] | None = None
+) -> dict[str, list[dict[str, str]]]:
     """
-    Returns the path to the user's credentials file.
+    Returns the files that are not in any form yet grouped by owner, for
+    the given users or for everybody, in a single query.
     """
     query = """
-SELECT gdf.file_id, gdf.file_name, gdf.file_is_public, gdf.file_url
+SELECT gdf.file_owner, gdf.file_id, gdf.file_name, gdf.file_is_public, gdf.file_url
 FROM google_drive_files AS gdf
-JOIN google_drive_users AS gdu ON gdf.file_owner = gdu.user_email
-WHERE gdu.user_email = %s;
+LEFT JOIN google_forms_files AS gff ON gdf.file_id = gff.file_id
+WHERE gff.file_id IS NULL
 """
+    if user_emails is not None:
+        if not user_emails:
+            return {}
+        placeholders = ", ".join(["%s"] * len(user_emails))
+        query += f"AND gdf.file_owner IN ({placeholders})\n"
+    query += "ORDER BY gdf.file_owner;"
 
-    # Execute the query
     cursor = connection.cursor(dictionary=True)
-    cursor.execute(query, (user_email,))
-
-    # Fetch and print the results
-    return cursor.fetchall()
+    cursor.execute(query, user_emails or ())
+    files_by_user: dict[str, list[dict[str, str]]] = {}
+    for file in cursor:
+        files_by_user.setdefault(file["file_owner"], []).append(file)
+    cursor.close()
+    return files_by_user
 
 
 def _build_question_for_file(item: dict[str, Any]) -> dict[str, Any]:
@@ -92,22 +102,16 @@ def _add_form_record(
     responser_uri: str,
     *,
     user_me: str,
-) -> bool:
-    try:
-        cursor = connection.cursor()
-        query = (
-            "INSERT INTO google_forms "
-            "(form_id, user_to, responser_uri, user_from) "
-            "VALUES (%s,%s,%s,%s)"
-        )
-        file_data = (form_id, user_dest_email, responser_uri, user_me)
-        cursor.execute(query, file_data)
-        connection.commit()
-        cursor.close()
-    except mysql.connector.Error as err:
-        if err.errno not in (1062,):
-            LOGGER.error("Failed to add form record: %s", err)
-    return True
+) -> None:
+    cursor = connection.cursor()
+    query = (
+        "INSERT INTO google_forms "
+        "(form_id, user_to, responser_uri, user_from) "
+        "VALUES (%s,%s,%s,%s)"
+    )
+    file_data = (form_id, user_dest_email, responser_uri, user_me)
+    cursor.execute(query, file_data)
+    cursor.close()
 
 
 def get_user_forms(connection: MySQLConnection, user: str) -> dict[str, Any]:
@@ -121,97 +125,64 @@ def get_user_forms(connection: MySQLConnection, user: str) -> dict[str, Any]:
     return result
 
 
-def _assign_file_to_form(
-    pool: MySQLConnectionPool, form_id: str, file_id: str, question_id: str
+def _assign_files_to_form(
+    connection: MySQLConnection,
+    form_id: str,
+    questions: list[tuple[str, str]],
 ) -> None:
-    connection = pool.get_connection()
-    try:
-        cursor = connection.cursor()
-        query = "INSERT INTO google_forms_files (form_id, file_id, question_id) VALUES (%s, %s, %s);"
-        values = (form_id, file_id, question_id)
-
-        # Execute the query
-        cursor.execute(query, values)
-
-        connection.commit()
-        cursor.close()
-    except mysql.connector.Error as err:
-        if err.errno not in (1062,):
-            LOGGER.error("Failed to add file to form: %s", err)
-    connection.close()
-
+    """
+    Stores the (file_id, question_id) pairs of a form in one statement.
+    """
+    cursor = connection.cursor()
+    query = (
+        "INSERT INTO google_forms_files (form_id, file_id, question_id) "
+        f"VALUES {multi_row_placeholders(len(questions), 3)};"
+    )
+    values = [
+        value
+        for file_id, question_id in questions
+        for value in (form_id, file_id, question_id)
+    ]
+    cursor.execute(query, values)
+    cursor.close()
 
-def _file_exists_in_form(pool: MySQLConnectionPool, file_id: str) -> bool:
-    connection = pool.get_connection()
-    try:
-        cursor = connection.cursor()
-        query = "SELECT * FROM google_forms_files WHERE file_id = %s;"
-        values = (file_id,)
 
-        # Execute the query
-        cursor.execute(query, values)
+def get_form_max_questions() -> int:
+    return int(
+        os.environ.get("FORM_MAX_QUESTIONS", DEFAULT_FORM_MAX_QUESTIONS)
+    )
 
-        result = cursor.fetchall()
-        cursor.close()
-    except mysql.connector.Error as err:
-        if err.errno not in (1062,):
-            LOGGER.error("Failed to check if file exists: %s", err)
 
-    connection.close()
-    return len(result) > 0
+def get_forms_concurrency() -> int:
+    return int(
+        os.environ.get("FORMS_MAX_CONCURRENCY", DEFAULT_FORMS_CONCURRENCY)
+    )
 
 
-def create_form_for_user(
-    credentials: Credentials,
-    connection_pool: MySQLConnectionPool,
+def _create_form(
+    form_service: Any,
+    connection_pool: ConnectionPool,
     user_email: str,
+    user_files: list[dict[str, str]],
     *,
+    title: str,
     me_email: str,
-) -> None:
-    form_service = discovery.build(
-        "forms",
-        "v1",
-        credentials=credentials,
-        discoveryServiceUrl=DISCOVERY_DOC,
-        static_discovery=False,
-    )
-    with connection_pool.get_connection() as connection:
-        user_files = _get_user_files(connection, user_email)
-
-    with ThreadPoolExecutor() as executor:
-        files_in_forms = dict(
-            executor.map(
-                lambda x: (
-                    x["file_id"],
-                    _file_exists_in_form(connection_pool, x["file_id"]),
-                ),
-                user_files,
-            )
-        )
-    user_files = [
-        file for file in user_files if not files_in_forms[file["file_id"]]
-    ]
-    if not user_files:
-        LOGGER.warning("No hay archivos para el usuario %s", user_email)
-        return
-
+) -> dict[str, str]:
     # Build the form with the questions
     items = [_build_question_for_file(item) for item in user_files]
-    result_new_form = (
-        form_service.forms()
-        .create(
+    result_new_form = execute_request(
+        form_service.forms().create(
             body={
                 "info": {
-                    "title": "Uso de archivos compartidos",
+                    "title": title,
                 }
             }
-        )
-        .execute()
+        ),
+        "forms",
     )
 
-    result_update = (
-        form_service.forms()
-        .batchUpdate(
+    result_update = execute_request(
+        form_service.forms().batchUpdate(
             formId=result_new_form["formId"],
             body={
                 "requests": [
@@ -224,80 +195,134 @@ def create_form_for_user(
                     for index, item in enumerate(items)
                 ]
             },
-        )
-        .execute()
+        ),
+        "forms",
     )
 
-    with connection_pool.get_connection() as connection:
-        _add_form_record(
-            connection,
-            result_new_form["formId"],
-            user_email,
-            result_new_form["responderUri"],
-            user_me=me_email,
-        )
-
     question_ids = [
         reply["createItem"]["questionId"][0]
         for reply in result_update["replies"]
     ]
-    with ThreadPoolExecutor() as executor:
-        executor.map(
-            _assign_file_to_form,
-            repeat(connection_pool),
-            repeat(result_new_form["formId"]),
-            [file["file_id"] for file in user_files],
-            question_ids,
-        )
+    # The form, its files and the email that announces it are stored in
+    # one transaction, so the email is queued only for recorded forms
+    with connection_pool.get_connection() as connection:
+        try:
+            _add_form_record(
+                connection,
+                result_new_form["formId"],
+                user_email,
+                result_new_form["responderUri"],
+                user_me=me_email,
+            )
+            _assign_files_to_form(
+                connection,
+                result_new_form["formId"],
+                list(
+                    zip([file["file_id"] for file in user_files], question_ids)
+                ),
+            )
+            enqueue_emails(
+                connection,
+                [
+                    form_email(
+                        user_email,
+                        result_new_form["formId"],
+                        result_new_form["responderUri"],
+                    )
+                ],
+            )
+            connection.commit()
+        except mysql.connector.Error as err:
+            connection.rollback()
+            LOGGER.error(
+                "Failed to record form %s: %s", result_new_form["formId"], err
+            )
+    return {
+        "form_id": result_new_form["formId"],
+        "user_to": user_email,
+        "responser_uri": result_new_form["responderUri"],
+    }
 
 
-def get_form_response(credentials: Credentials, form_id: str) -> None:
-    service = discovery.build(
-        "forms",
-        "v1",
-        credentials=credentials,
-        discoveryServiceUrl=DISCOVERY_DOC,
-        static_discovery=False,
-    )
+def create_form_for_user(
+    credentials: Credentials,
+    connection_pool: ConnectionPool,
+    user_email: str,
+    *,
+    me_email: str,
+    user_files: list[dict[str, str]] | None = None,
+    max_questions: int | None = None,
+) -> list[dict[str, str]]:
+    """
+    Creates the forms asking the user about their files, splitting them in
+    forms of at most max_questions questions, queues the email announcing
+    every form in the outbox and returns the new forms.
+    """
+    form_service = get_service("forms", "v1", credentials)
+    max_questions = max_questions or get_form_max_questions()
+    if user_files is None:
+        with connection_pool.get_connection() as connection:
+            user_files = get_pending_files(connection, [user_email]).get(
+                user_email, []
+            )
 
-    # Prints the title of the sample form:
-    result = service.forms().responses().list(formId=form_id).execute()
-    return result["responses"][0]["answers"]
+    if not user_files:
+        LOGGER.warning("No hay archivos para el usuario %s", user_email)
+        return []
 
+    chunks = list(batched(user_files, max_questions))
+    return [
+        _create_form(
+            form_service,
+            connection_pool,
+            user_email,
+            chunk,
+            title=(
+                f"{FORM_TITLE} ({index}/{len(chunks)})"
+                if len(chunks) > 1
+                else FORM_TITLE
+            ),
+            me_email=me_email,
+        )
+        for index, chunk in enumerate(chunks, start=1)
+    ]
 
-def process_answers_severity(answers: list[dict[str, str]]) -> str:
-    severities = []
-    answers_map = {
-        "está relacionado con procesos legales o confidenciales?": 4,
-        "es necesario para la operación diaria de la empresa?": 3,
-        "se comparte con partes externas a la organización?": 2,
-        "está en uso activo en proyectos actuales?": 2,
-        "contiene información de uso común y conocida?": 1,
-    }
-    severity_map = {
-        4: "Critico",
-        3: "Alto",
-        2: "Medio",
-        1: "Bajo",
-        0: "Desconocido",
-    }
-    for answer in answers:
-        if severity_value := answers_map.get(answer["value"]):
-            severities.append(severity_value)
 
-    return severity_map.get(
-        (max(severities) if severities else 0), "Desconocido"
-    )
+def get_form_responses(
+    credentials: Credentials, form_id: str
+) -> list[dict[str, Any]]:
+    service = get_service("forms", "v1", credentials)
+    request = service.forms().responses().list(formId=form_id)
+    responses: list[dict[str, Any]] = []
+    while request is not None:
+        result = execute_request(request, "forms")
+        responses.extend(result.get("responses", []))
+        request = service.forms().responses().list_next(
+            previous_request=request, previous_response=result
+        )
+    return responses
 
 
-def get_file_questions_in_form(
-    connection: MySQLConnection, form_id: str
-) -> list[dict[str, str]]:
-    query = """
-    SELECT * FROM google_forms_files WHERE form_id = %s;
+def flatten_question_answers(
+    responses_by_form: Iterable[list[dict[str, Any]]]
+) -> tuple[list[str], list[str]]:
     """
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute(query, (form_id,))
-    result = cursor.fetchall()
-    cursor.close()
-    return result
+    Returns the question id and the text of every answer of every response
+    of every form. Questions without a text answer are kept with an empty
+    answer so that they are still scored.
+    """
+    question_ids: list[str] = []
+    answers: list[str] = []
+    for responses in responses_by_form:
+        for response in responses:
+            for question_id, answer in response.get("answers", {}).items():
+                values = [
+                    item["value"]
+                    for item in answer.get("textAnswers", {}).get(
+                        "answers", []
+                    )
+                ] or [""]
+                question_ids.extend([question_id] * len(values))
+                answers.extend(values)
+    return question_ids, answers
+
@@ -0,0 +1,148 @@
+from contextlib import (
+    contextmanager,
+)
+import os
+from pathlib import (
+    Path,
+)
+import tempfile
+import threading
+import time
+from typing import (
+    Callable,
+    Iterator,
+)
+
+PREFIX = "challeng"
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and timers rendered in the OpenMetrics
+    text format. Timers are summaries, so every timed metric has a count
+    and a sum of seconds. Collectors are called before every render to set
+    the gauges of state kept elsewhere, such as the connection pools.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._gauges: dict[str, dict[Labels, float]] = {}
+        self._collectors: list[Callable[["MetricsRegistry"], None]] = []
+        self._summaries: dict[str, dict[Labels, list[float]]] = {}
+        self._help: dict[str, str] = {}
+
+    def describe(self, name: str, description: str) -> None:
+        self._help[name] = description
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            metric = self._counters.setdefault(name, {})
+            metric[key] = metric.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def add_collector(
+        self, collector: Callable[["MetricsRegistry"], None]
+    ) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            summary = self._summaries.setdefault(name, {}).setdefault(
+                key, [0, 0.0]
+            )
+            summary[0] += 1
+            summary[1] += seconds
+
+    @contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            collector(self)
+        lines: list[str] = []
+        with self._lock:
+            for name, values in sorted(self._counters.items()):
+                self._render_header(lines, name, "counter")
+                for labels, value in sorted(values.items()):
+                    lines.append(
+                        f"{PREFIX}_{name}_total{_labels(labels)} {value}"
+                    )
+            for name, values in sorted(self._gauges.items()):
+                self._render_header(lines, name, "gauge")
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{PREFIX}_{name}{_labels(labels)} {value}")
+            for name, summaries in sorted(self._summaries.items()):
+                self._render_header(lines, name, "summary")
+                for labels, (count, total) in sorted(summaries.items()):
+                    lines.append(
+                        f"{PREFIX}_{name}_count{_labels(labels)} {count}"
+                    )
+                    lines.append(
+                        f"{PREFIX}_{name}_sum{_labels(labels)} {total:.6f}"
+                    )
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _render_header(self, lines: list[str], name: str, kind: str) -> None:
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        if name in self._help:
+            lines.append(f"# HELP {PREFIX}_{name} {self._help[name]}")
+
+    def write_textfile(self, path: Path) -> None:
+        """
+        Writes the metrics atomically, as the node_exporter textfile
+        collector expects.
+        """
+        with tempfile.NamedTemporaryFile(
+            "w", dir=path.parent, delete=False, encoding="utf-8"
+        ) as file:
+            file.write(self.render())
+        os.replace(file.name, path)
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("api_clients", "Google API clients built or reused")
+METRICS.describe("api_request_seconds", "Google API calls by method")
+METRICS.describe("api_limiter_calls", "Calls let through by the limiter")
+METRICS.describe("api_limiter_failures", "Calls that failed after retries")
+METRICS.describe("api_limiter_retries", "Calls retried after an error")
+METRICS.describe("api_limiter_throttled_seconds", "Time held by the limiter")
+METRICS.describe("api_limiter_used_today", "Calls counted against the day")
+METRICS.describe("api_wait_seconds", "Time throttled by the rate limiters")
+METRICS.describe("daemon_runs", "Runs of every daemon job")
+METRICS.describe("db_query_seconds", "MySQL statements by kind and table")
+METRICS.describe("db_pool_wait_seconds", "Time waiting for a connection")
+METRICS.describe("db_pool_size", "Connections of every pool")
+METRICS.describe("db_pool_in_use", "Connections checked out")
+METRICS.describe("db_pool_peak_in_use", "Most connections out at once")
+METRICS.describe("db_pool_utilisation", "Peak connections out over size")
+METRICS.describe("db_pool_timeouts", "Checkouts that got no connection")
+METRICS.describe("db_pool_recycled", "Connections reopened for their age")
+METRICS.describe("stage_seconds", "Time spent in every command stage")
@@ -0,0 +1,6 @@
+-- Questions are looked up by form and by question id when severities are
+-- applied, and every question belongs to exactly one form
+ALTER TABLE google_forms_files
+    MODIFY question_id VARCHAR(15) NOT NULL,
+    ADD PRIMARY KEY (form_id, question_id),
+    ADD INDEX idx_google_forms_files_question_id (question_id);
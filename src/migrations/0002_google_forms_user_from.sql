@@ -0,0 +1,2 @@
+-- get_user_forms filters the forms by sender
+CREATE INDEX idx_google_forms_user_from ON google_forms (user_from);
@@ -0,0 +1,5 @@
+-- iter_public_files_by_owner filters by severity and visibility, and the
+-- pending files of a user are looked up by owner
+CREATE INDEX idx_google_drive_files_severity_public
+    ON google_drive_files (severity, file_is_public);
+CREATE INDEX idx_google_drive_files_owner ON google_drive_files (file_owner);
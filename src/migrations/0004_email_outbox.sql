@@ -0,0 +1,22 @@
+-- Emails are queued in the same transaction that records their reason and
+-- sent by src.outbox, which marks every row as sent only after Gmail
+-- accepts it. The idempotency key keeps a rerun from queueing them twice.
+CREATE TABLE email_outbox (
+    outbox_id BIGINT NOT NULL AUTO_INCREMENT,
+    idempotency_key VARCHAR(64) NOT NULL,
+    kind VARCHAR(50) NOT NULL,
+    recipient VARCHAR(255) NOT NULL,
+    payload JSON NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    claimed_until TIMESTAMP NULL,
+    last_error VARCHAR(1000),
+    message_id VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP NULL,
+    PRIMARY KEY (outbox_id),
+    UNIQUE KEY uq_email_outbox_idempotency_key (idempotency_key)
+);
+
+-- Workers claim the pending rows and the ones whose claim expired
+CREATE INDEX idx_email_outbox_status ON email_outbox (status, claimed_until);
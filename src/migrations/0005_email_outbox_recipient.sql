@@ -0,0 +1,2 @@
+-- The outbox is claimed by recipient to send one digest per recipient
+CREATE INDEX idx_email_outbox_recipient ON email_outbox (recipient, status);
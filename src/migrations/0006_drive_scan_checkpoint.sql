@@ -0,0 +1,13 @@
+-- The progress of the running scan, saved after every committed page so
+-- that --scan --resume can continue an interrupted scan
+CREATE TABLE drive_scan_checkpoint (
+    checkpoint_key VARCHAR(50) NOT NULL,
+    scan_kind VARCHAR(20) NOT NULL,
+    page_token VARCHAR(1024),
+    start_page_token VARCHAR(255),
+    pages INT NOT NULL DEFAULT 0,
+    items INT NOT NULL DEFAULT 0,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (checkpoint_key)
+);
@@ -0,0 +1,7 @@
+-- The Drive changes token that the next --scan continues from
+CREATE TABLE drive_scan_state (
+    state_key VARCHAR(50) NOT NULL,
+    state_value VARCHAR(255),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (state_key)
+);
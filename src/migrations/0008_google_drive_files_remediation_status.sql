@@ -0,0 +1,2 @@
+-- The outcome of the last --remediate run on every file
+ALTER TABLE google_drive_files ADD COLUMN remediation_status VARCHAR(50);
@@ -0,0 +1,159 @@
+import logging
+import mysql.connector
+from mysql.connector import (
+    errorcode,
+)
+from mysql.connector.connection import (
+    MySQLConnection,
+)
+from pathlib import (
+    Path,
+)
+from typing import (
+    Any,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+MIGRATIONS_PATH = Path(__file__).parent
+# MySQL commits every DDL statement on its own, so a migration that failed
+# halfway keeps its first statements. When it runs again, the statements
+# whose table, column or index already exists are skipped. This also lets
+# the migrations run on databases that already have part of the schema.
+ALREADY_APPLIED_ERRORS = {
+    errorcode.ER_TABLE_EXISTS_ERROR,
+    errorcode.ER_DUP_FIELDNAME,
+    errorcode.ER_DUP_KEYNAME,
+    errorcode.ER_MULTIPLE_PRI_KEY,
+}
+
+# The hot queries of the application and the index each of them needs
+EXPLAIN_CHECKS: list[tuple[str, tuple[Any, ...], str]] = [
+    (
+        "SELECT user_to, form_id, responser_uri FROM google_forms "
+        "WHERE user_from = %s",
+        ("",),
+        "idx_google_forms_user_from",
+    ),
+    (
+        "SELECT form_id, file_id, question_id FROM google_forms_files "
+        "WHERE form_id = %s",
+        ("",),
+        "PRIMARY",
+    ),
+    (
+        "SELECT file_id FROM google_forms_files WHERE question_id = %s",
+        ("",),
+        "idx_google_forms_files_question_id",
+    ),
+    (
+        "SELECT file_id, file_name, file_url, file_owner, severity "
+        "FROM google_drive_files "
+        "WHERE severity IN (%s, %s) AND file_is_public = TRUE "
+        "ORDER BY file_owner",
+        ("Critico", "Alto"),
+        "idx_google_drive_files_severity_public",
+    ),
+    (
+        "SELECT file_id FROM google_drive_files WHERE file_owner = %s",
+        ("",),
+        "idx_google_drive_files_owner",
+    ),
+]
+
+
+def _get_migrations() -> list[tuple[str, Path]]:
+    return [
+        (path.stem, path) for path in sorted(MIGRATIONS_PATH.glob("*.sql"))
+    ]
+
+
+def _split_statements(sql: str) -> list[str]:
+    lines = [
+        line
+        for line in sql.splitlines()
+        if not line.strip().startswith("--")
+    ]
+    return [
+        statement.strip()
+        for statement in "\n".join(lines).split(";")
+        if statement.strip()
+    ]
+
+
+def get_applied_migrations(connection: MySQLConnection) -> set[str]:
+    cursor = connection.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "PRIMARY KEY (version))"
+    )
+    cursor.execute("SELECT version FROM schema_migrations")
+    result = {version for (version,) in cursor}
+    cursor.close()
+    return result
+
+
+def _execute_ddl(cursor: Any, version: str, statement: str) -> None:
+    try:
+        cursor.execute(statement)
+    except mysql.connector.Error as err:
+        if err.errno not in ALREADY_APPLIED_ERRORS:
+            raise
+        LOGGER.warning("Skipping applied statement of %s: %s", version, err)
+
+
+def run_migrations(connection: MySQLConnection) -> list[str]:
+    """
+    Applies the numbered SQL files of this package that have not run yet,
+    in order, and records each of them in schema_migrations. Stops at the
+    first migration that fails; statements whose object already exists
+    are skipped, so it can be run again.
+    """
+    applied = get_applied_migrations(connection)
+    newly_applied: list[str] = []
+    cursor = connection.cursor()
+    for version, path in _get_migrations():
+        if version in applied:
+            continue
+        try:
+            for statement in _split_statements(
+                path.read_text(encoding="utf-8")
+            ):
+                _execute_ddl(cursor, version, statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version) VALUES (%s)",
+                (version,),
+            )
+            connection.commit()
+        except mysql.connector.Error as err:
+            connection.rollback()
+            LOGGER.error("Failed to apply migration %s: %s", version, err)
+            raise
+        LOGGER.warning("Applied migration %s", version)
+        newly_applied.append(version)
+    cursor.close()
+    return newly_applied
+
+
+def verify_indexes(connection: MySQLConnection) -> list[str]:
+    """
+    Runs EXPLAIN on every hot query and returns the expected indexes that
+    the optimizer cannot use.
+    """
+    missing: list[str] = []
+    cursor = connection.cursor(dictionary=True)
+    for query, params, index in EXPLAIN_CHECKS:
+        cursor.execute(f"EXPLAIN {query}", params)
+        plan = cursor.fetchall()
+        possible_keys = {
+            key
+            for row in plan
+            for key in (row.get("possible_keys") or "").split(",")
+        }
+        if index not in possible_keys:
+            LOGGER.error("Query cannot use %s: %s", index, query)
+            missing.append(index)
+    cursor.close()
+    return missing
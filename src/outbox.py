@@ -0,0 +1,450 @@
+from collections import (
+    Counter,
+)
+from concurrent.futures import (
+    Executor,
+    ThreadPoolExecutor,
+)
+from datetime import (
+    date,
+)
+from google.oauth2.credentials import (
+    Credentials,
+)
+from googleapiclient.errors import (
+    HttpError,
+)
+import hashlib
+from itertools import (
+    groupby,
+)
+import json
+import logging
+import mysql.connector
+from mysql.connector.connection import (
+    MySQLConnection,
+)
+from operator import (
+    itemgetter,
+)
+import os
+from src.database import (
+    ConnectionPool,
+    get_batch_size,
+    multi_row_placeholders,
+)
+from src.email_manage import (
+    CHANGE_PERMISSION_SUBJECT,
+    DIGEST_SUBJECT,
+    FORM_SUBJECT,
+    change_permission_body,
+    compile_template,
+    form_body,
+    render_message,
+    send_raw_message,
+)
+from src.rate_limit import (
+    QuotaExhaustedError,
+)
+from src.utils import (
+    batched,
+)
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    NamedTuple,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+OUTBOX_PENDING = "pending"
+OUTBOX_SENDING = "sending"
+OUTBOX_SENT = "sent"
+OUTBOX_FAILED = "failed"
+
+KIND_FORM = "form"
+KIND_CHANGE_PERMISSION = "change_permission"
+
+DEFAULT_OUTBOX_WORKERS = 4
+DEFAULT_OUTBOX_CLAIM_SIZE = 100
+DEFAULT_DIGEST_WINDOW = 0
+# A claim that is not released in this time is considered abandoned by a
+# crashed worker and its emails are sent again
+CLAIM_LEASE_SECONDS = 600
+RETRY_DELAY_SECONDS = 300
+MAX_ATTEMPTS = 5
+
+
+class OutboxEmail(NamedTuple):
+    kind: str
+    recipient: str
+    payload: dict[str, Any]
+    idempotency_key: str
+
+
+def form_email(user_to: str, form_id: str, form_link: str) -> OutboxEmail:
+    return OutboxEmail(
+        kind=KIND_FORM,
+        recipient=user_to,
+        payload={"form_id": form_id, "form_link": form_link},
+        idempotency_key=f"{KIND_FORM}:{form_id}",
+    )
+
+
+def change_permission_email(
+    user_to: str, files: list[dict[str, str]]
+) -> OutboxEmail:
+    # The same owner and files are notified at most once a day
+    digest = hashlib.sha256(
+        "\n".join(
+            [user_to, date.today().isoformat()]
+            + sorted(file["file_id"] for file in files)
+        ).encode()
+    ).hexdigest()
+    return OutboxEmail(
+        kind=KIND_CHANGE_PERMISSION,
+        recipient=user_to,
+        payload={
+            "files": [
+                {
+                    "file_id": file["file_id"],
+                    "file_name": file["file_name"],
+                    "file_url": file["file_url"],
+                }
+                for file in files
+            ]
+        },
+        idempotency_key=f"{KIND_CHANGE_PERMISSION}:{digest[:40]}",
+    )
+
+
+BODY_BUILDERS: dict[str, Callable[[dict[str, Any]], str]] = {
+    KIND_FORM: lambda payload: form_body(payload["form_link"]),
+    KIND_CHANGE_PERMISSION: lambda payload: change_permission_body(
+        payload["files"]
+    ),
+}
+# Digests with a single kind of notification keep its subject
+TEMPLATES = {
+    KIND_FORM: compile_template(FORM_SUBJECT),
+    KIND_CHANGE_PERMISSION: compile_template(CHANGE_PERMISSION_SUBJECT),
+}
+DIGEST_TEMPLATE = compile_template(DIGEST_SUBJECT)
+DIGEST_SEPARATOR = "\n\n---\n\n"
+
+
+def enqueue_emails(
+    connection: MySQLConnection, emails: list[OutboxEmail]
+) -> int:
+    """
+    Queues the emails in the current transaction of `connection`, which
+    the caller commits together with the rows the emails are about.
+    Emails whose idempotency key is already queued are ignored.
+    """
+    if not emails:
+        return 0
+    cursor = connection.cursor()
+    query = (
+        "INSERT INTO email_outbox "
+        "(idempotency_key, kind, recipient, payload) "
+        f"VALUES {multi_row_placeholders(len(emails), 4)} "
+        "ON DUPLICATE KEY UPDATE outbox_id = outbox_id"
+    )
+    values = [
+        value
+        for email in emails
+        for value in (
+            email.idempotency_key,
+            email.kind,
+            email.recipient,
+            json.dumps(email.payload),
+        )
+    ]
+    cursor.execute(query, values)
+    queued = cursor.rowcount
+    cursor.close()
+    return queued
+
+
+def add_outbox_emails(
+    connection_pool: ConnectionPool,
+    emails: Iterable[OutboxEmail],
+    batch_size: int | None = None,
+    on_commit: Callable[[list[OutboxEmail]], None] | None = None,
+) -> int:
+    """
+    Queues the emails in multi-row statements, one transaction per batch.
+    `on_commit` is called with every batch once it is committed, e.g. to
+    send its emails while the next batch is queued.
+    """
+    batch_size = batch_size or get_batch_size()
+    queued = 0
+    connection = connection_pool.get_connection()
+    try:
+        for batch in batched(emails, batch_size):
+            batch = list(batch)
+            try:
+                queued += enqueue_emails(connection, batch)
+                connection.commit()
+            except mysql.connector.Error as err:
+                connection.rollback()
+                LOGGER.error("Failed to queue emails: %s", err)
+                raise
+            if on_commit:
+                on_commit(batch)
+    finally:
+        connection.close()
+    return queued
+
+
+def claim_emails(
+    connection_pool: ConnectionPool,
+    limit: int,
+    window: float = 0,
+    recipients: list[str] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Claims every email of up to `limit` recipients for
+    CLAIM_LEASE_SECONDS, ordered by recipient. A recipient is claimed
+    through its oldest claimable email: those rows are locked with SKIP
+    LOCKED, so a recipient another worker is claiming is skipped as a
+    whole and its emails are never split between two digests. The rest of
+    its emails are then locked and claimed in the same transaction.
+    claimed_until also delays the retry of failed sends.
+
+    With a `window`, the emails of a recipient are held until the oldest
+    of them has waited `window` seconds, so that the ones queued meanwhile
+    join the same digest. `recipients` restricts the claim to them.
+    """
+    claimable = (
+        "status IN (%s, %s) "
+        "AND (claimed_until IS NULL OR claimed_until < NOW())"
+    )
+    heads_query = (
+        "SELECT o.recipient FROM email_outbox AS o "
+        "JOIN (SELECT recipient, MIN(outbox_id) AS outbox_id "
+        f"FROM email_outbox WHERE {claimable} GROUP BY recipient) AS h "
+        "ON h.outbox_id = o.outbox_id "
+        # The locking read sees the latest rows, whose claim may have
+        # been committed since the heads were grouped
+        f"WHERE {claimable} "
+    )
+    heads_params: list[Any] = [OUTBOX_PENDING, OUTBOX_SENDING] * 2
+    if window:
+        heads_query += "AND o.created_at <= NOW() - INTERVAL %s SECOND "
+        heads_params.append(window)
+    if recipients:
+        placeholders = ", ".join(["%s"] * len(recipients))
+        heads_query += f"AND o.recipient IN ({placeholders}) "
+        heads_params.extend(recipients)
+    heads_query += "ORDER BY o.recipient LIMIT %s FOR UPDATE OF o SKIP LOCKED"
+    heads_params.append(limit)
+
+    rows: list[dict[str, Any]] = []
+    with connection_pool.get_connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(heads_query, heads_params)
+            recipients = [row["recipient"] for row in cursor.fetchall()]
+            if recipients:
+                placeholders = ", ".join(["%s"] * len(recipients))
+                cursor.execute(
+                    "SELECT outbox_id, kind, recipient, payload, attempts "
+                    f"FROM email_outbox WHERE {claimable} "
+                    f"AND recipient IN ({placeholders}) "
+                    "ORDER BY recipient, outbox_id FOR UPDATE",
+                    (OUTBOX_PENDING, OUTBOX_SENDING, *recipients),
+                )
+                rows = cursor.fetchall()
+            if rows:
+                placeholders = ", ".join(["%s"] * len(rows))
+                cursor.execute(
+                    "UPDATE email_outbox SET status = %s, "
+                    "claimed_until = NOW() + INTERVAL %s SECOND, "
+                    "attempts = attempts + 1 "
+                    f"WHERE outbox_id IN ({placeholders})",
+                    (
+                        OUTBOX_SENDING,
+                        CLAIM_LEASE_SECONDS,
+                        *(row["outbox_id"] for row in rows),
+                    ),
+                )
+            connection.commit()
+        except mysql.connector.Error as err:
+            connection.rollback()
+            LOGGER.error("Failed to claim emails: %s", err)
+            raise
+        finally:
+            cursor.close()
+    return rows
+
+
+def _mark_sent(
+    connection_pool: ConnectionPool,
+    outbox_ids: list[int],
+    message_id: str | None,
+) -> None:
+    placeholders = ", ".join(["%s"] * len(outbox_ids))
+    with connection_pool.get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE email_outbox SET status = %s, message_id = %s, "
+            "claimed_until = NULL, last_error = NULL, sent_at = NOW() "
+            f"WHERE outbox_id IN ({placeholders})",
+            (OUTBOX_SENT, message_id, *outbox_ids),
+        )
+        connection.commit()
+        cursor.close()
+
+
+def _mark_failed(
+    connection_pool: ConnectionPool,
+    statuses: dict[int, str],
+    error: str,
+) -> None:
+    # Pending emails are retried after RETRY_DELAY_SECONDS
+    with connection_pool.get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.executemany(
+            "UPDATE email_outbox SET status = %s, last_error = %s, "
+            "claimed_until = NOW() + INTERVAL %s SECOND "
+            "WHERE outbox_id = %s",
+            [
+                (status, error[:1000], RETRY_DELAY_SECONDS, outbox_id)
+                for outbox_id, status in statuses.items()
+            ],
+        )
+        connection.commit()
+        cursor.close()
+
+
+def render_digest(recipient: str, rows: list[dict[str, Any]]) -> bytes:
+    """
+    Renders every notification of `rows` into one message for `recipient`
+    from the precompiled templates.
+    """
+    sections = []
+    for row in rows:
+        payload = row["payload"]
+        if isinstance(payload, (str, bytes)):
+            payload = json.loads(payload)
+        sections.append(BODY_BUILDERS[row["kind"]](payload))
+    kinds = {row["kind"] for row in rows}
+    template = (
+        TEMPLATES[next(iter(kinds))] if len(kinds) == 1 else DIGEST_TEMPLATE
+    )
+    return render_message(template, recipient, DIGEST_SEPARATOR.join(sections))
+
+
+def _send_digest(
+    credentials: Credentials,
+    connection_pool: ConnectionPool,
+    recipient: str,
+    rows: list[dict[str, Any]],
+) -> Counter:
+    try:
+        response = send_raw_message(
+            credentials, render_digest(recipient, rows)
+        )
+    except HttpError as error:
+        # attempts was increased when the emails were claimed
+        statuses = {
+            row["outbox_id"]: (
+                OUTBOX_FAILED
+                if row["attempts"] + 1 >= MAX_ATTEMPTS
+                else OUTBOX_PENDING
+            )
+            for row in rows
+        }
+        LOGGER.error("Failed to send email to %s: %s", recipient, error)
+        _mark_failed(connection_pool, statuses, str(error))
+        return Counter(statuses.values())
+    _mark_sent(
+        connection_pool,
+        [row["outbox_id"] for row in rows],
+        (response or {}).get("id"),
+    )
+    return Counter({OUTBOX_SENT: len(rows), "messages": 1})
+
+
+def _send_claimed(
+    credentials: Credentials,
+    connection_pool: ConnectionPool,
+    rows: list[dict[str, Any]],
+) -> Counter:
+    summary: Counter = Counter()
+    for recipient, digest in groupby(rows, key=itemgetter("recipient")):
+        summary += _send_digest(
+            credentials, connection_pool, recipient, list(digest)
+        )
+    return summary
+
+
+def send_recipient_emails(
+    credentials: Credentials, connection_pool: ConnectionPool, recipient: str
+) -> Counter:
+    """
+    Sends every queued email of `recipient` now as one digest, without
+    waiting for the digest window, e.g. once all of them are committed.
+    Nothing is sent when another worker is claiming them.
+    """
+    try:
+        rows = claim_emails(connection_pool, 1, recipients=[recipient])
+        return _send_claimed(credentials, connection_pool, rows)
+    except QuotaExhaustedError as error:
+        LOGGER.warning("Stopped sending emails: %s", error)
+        return Counter()
+
+
+def get_outbox_workers() -> int:
+    return int(os.environ.get("OUTBOX_WORKERS", DEFAULT_OUTBOX_WORKERS))
+
+
+def get_outbox_claim_size() -> int:
+    return int(os.environ.get("OUTBOX_CLAIM_SIZE", DEFAULT_OUTBOX_CLAIM_SIZE))
+
+
+def get_digest_window() -> float:
+    return float(os.environ.get("OUTBOX_DIGEST_WINDOW", DEFAULT_DIGEST_WINDOW))
+
+
+def drain_outbox(
+    credentials: Credentials,
+    connection_pool: ConnectionPool,
+    *,
+    workers: int | None = None,
+    claim_size: int | None = None,
+    window: float | None = None,
+    executor: Executor | None = None,
+) -> Counter:
+    """
+    Sends the queued emails with `workers` workers until none is left to
+    claim, as one digest per recipient and `claim_size` recipients per
+    claim, and returns how many emails ended in every status and how many
+    messages were sent. An email is marked as sent only once Gmail
+    accepted it, so a crash can at worst send the emails claimed at that
+    moment again. The workers run in `executor` when one is given, so that
+    their Gmail clients are reused, or else in a new one.
+    """
+    workers = workers or get_outbox_workers()
+    claim_size = claim_size or get_outbox_claim_size()
+    window = get_digest_window() if window is None else window
+
+    def work() -> Counter:
+        summary: Counter = Counter()
+        try:
+            while rows := claim_emails(connection_pool, claim_size, window):
+                summary += _send_claimed(credentials, connection_pool, rows)
+        except QuotaExhaustedError as error:
+            # The emails left keep their claim and go out on a later run
+            # once the lease expires
+            LOGGER.warning("Stopped sending emails: %s", error)
+        return summary
+
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(work) for _ in range(workers)]
+    else:
+        futures = [executor.submit(work) for _ in range(workers)]
+    return sum((future.result() for future in futures), Counter())
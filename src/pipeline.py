@@ -0,0 +1,129 @@
+import asyncio
+from collections import (
+    Counter,
+)
+from concurrent.futures import (
+    Executor,
+    ThreadPoolExecutor,
+)
+from functools import (
+    partial,
+)
+from google.oauth2.credentials import (
+    Credentials,
+)
+import logging
+from src.database import (
+    ConnectionPool,
+)
+from src.forms import (
+    create_form_for_user,
+)
+from src.metrics import (
+    METRICS,
+)
+from src.outbox import (
+    send_recipient_emails,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+
+async def _send_user_forms(
+    semaphore: asyncio.Semaphore,
+    executor: Executor,
+    credentials: Credentials,
+    connection_pool: ConnectionPool,
+    user_email: str,
+    user_files: list[dict[str, str]],
+    *,
+    me_email: str,
+) -> tuple[int, Counter]:
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        with METRICS.time(
+            "stage_seconds", command="send-forms", stage="create_forms"
+        ):
+            forms = await loop.run_in_executor(
+                executor,
+                partial(
+                    create_form_for_user,
+                    credentials,
+                    connection_pool,
+                    user_email,
+                    me_email=me_email,
+                    user_files=user_files,
+                ),
+            )
+    if not forms:
+        return 0, Counter()
+    # Every form of the user is committed, so their emails go out as one
+    # digest while the forms of the other users are still being created
+    with METRICS.time(
+        "stage_seconds", command="send-forms", stage="send_emails"
+    ):
+        emails = await loop.run_in_executor(
+            executor,
+            send_recipient_emails,
+            credentials,
+            connection_pool,
+            user_email,
+        )
+    return len(forms), emails
+
+
+async def send_forms_pipeline(
+    credentials: Credentials,
+    connection_pool: ConnectionPool,
+    files_by_user: dict[str, list[dict[str, str]]],
+    *,
+    me_email: str,
+    concurrency: int,
+    executor: Executor | None = None,
+) -> tuple[int, Counter]:
+    """
+    Creates and records the forms of every user, queueing their emails in
+    the outbox, and sends the emails of every user once their forms are
+    done, as one task per user. At most `concurrency` users have their
+    forms created at once. Returns the number of forms and the outbox
+    summary of the emails sent.
+
+    The blocking calls run in `executor`, which the daemon keeps between
+    runs so that the API clients of its threads stay warm, or else in a
+    new one of `concurrency` threads.
+    """
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return await send_forms_pipeline(
+                credentials,
+                connection_pool,
+                files_by_user,
+                me_email=me_email,
+                concurrency=concurrency,
+                executor=executor,
+            )
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = {
+        asyncio.create_task(
+            _send_user_forms(
+                semaphore,
+                executor,
+                credentials,
+                connection_pool,
+                user_email,
+                user_files,
+                me_email=me_email,
+            )
+        ): user_email
+        for user_email, user_files in files_by_user.items()
+    }
+    sent_forms = 0
+    emails: Counter = Counter()
+    for task in asyncio.as_completed(tasks):
+        try:
+            user_forms, user_emails = await task
+            sent_forms += user_forms
+            emails += user_emails
+        except Exception as error:  # pylint: disable=broad-except
+            LOGGER.error("Failed to send forms: %s", error)
+    return sent_forms, emails
@@ -0,0 +1,209 @@
+from datetime import (
+    date,
+)
+from googleapiclient.errors import (
+    HttpError,
+)
+from googleapiclient.http import (
+    HttpRequest,
+)
+import json
+import logging
+import os
+import random
+from src.metrics import (
+    METRICS,
+    MetricsRegistry,
+)
+import threading
+import time
+from typing import (
+    Any,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+# Budgets per user, see the quota pages of every API. Gmail charges 100
+# units of its 250 units per second to every messages.send call.
+DEFAULT_LIMITS = {
+    "drive": (100.0, 0),
+    "forms": (2.0, 0),
+    "gmail": (2.0, 2000),
+}
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+
+
+class QuotaExhaustedError(Exception):
+    pass
+
+
+class RateLimiter:
+    """
+    Token bucket that allows per_second calls per second on average, with
+    bursts of up to one second worth of calls, and at most per_day calls
+    per day (0 means no daily limit). The calls of the day are counted in
+    memory, so per_day only holds within one process, e.g. the daemon:
+    every command run starts counting from zero.
+    """
+
+    def __init__(self, name: str, per_second: float, per_day: int) -> None:
+        self.name = name
+        self.per_second = per_second
+        self.per_day = per_day
+        self.capacity = max(per_second, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._day = date.today()
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "throttled_seconds": 0.0,
+            "retries": 0,
+            "failures": 0,
+            "used_today": 0,
+        }
+
+    def acquire(self, tokens: int = 1) -> None:
+        while True:
+            with self._lock:
+                self._check_daily_budget(tokens)
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.per_second,
+                )
+                self._updated_at = now
+                # Requests bigger than the bucket go into debt instead of
+                # waiting forever
+                needed = min(tokens, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    self.stats["calls"] += tokens
+                    self.stats["used_today"] += tokens
+                    return
+                wait = (needed - self._tokens) / self.per_second
+                self.stats["throttled_seconds"] += wait
+            time.sleep(wait)
+
+    def _check_daily_budget(self, tokens: int) -> None:
+        if self._day != date.today():
+            self._day = date.today()
+            self.stats["used_today"] = 0
+        if self.per_day and self.stats["used_today"] + tokens > self.per_day:
+            raise QuotaExhaustedError(
+                f"Daily {self.name} quota of {self.per_day} calls exhausted"
+            )
+
+    def count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+
+_LIMITERS: dict[str, RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(api: str) -> RateLimiter:
+    with _LIMITERS_LOCK:
+        if api not in _LIMITERS:
+            per_second, per_day = DEFAULT_LIMITS[api]
+            _LIMITERS[api] = RateLimiter(
+                api,
+                float(
+                    os.environ.get(
+                        f"{api.upper()}_RATE_PER_SECOND", per_second
+                    )
+                ),
+                int(os.environ.get(f"{api.upper()}_RATE_PER_DAY", per_day)),
+            )
+        return _LIMITERS[api]
+
+
+def get_rate_limit_stats() -> dict[str, dict[str, float]]:
+    with _LIMITERS_LOCK:
+        return {api: dict(limiter.stats) for api, limiter in _LIMITERS.items()}
+
+
+def _collect_rate_limit_stats(metrics: MetricsRegistry) -> None:
+    for api, stats in get_rate_limit_stats().items():
+        for stat, value in stats.items():
+            metrics.set(f"api_limiter_{stat}", value, service=api)
+
+
+METRICS.add_collector(_collect_rate_limit_stats)
+
+
+def is_retryable(error: HttpError) -> bool:
+    if error.resp.status in RETRYABLE_STATUSES:
+        return True
+    if error.resp.status != 403:
+        return False
+    try:
+        errors = json.loads(error.content)["error"].get("errors", [])
+    except (ValueError, KeyError, TypeError):
+        return False
+    return any(item.get("reason") in RATE_LIMIT_REASONS for item in errors)
+
+
+def _backoff(error: HttpError, attempt: int) -> float:
+    # Full jitter, but never sooner than the server asked for
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+    retry_after = error.resp.get("retry-after", "")
+    return max(delay, float(retry_after)) if retry_after.isdigit() else delay
+
+
+def execute_request(
+    request: HttpRequest,
+    api: str,
+    *,
+    tokens: int = 1,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> Any:
+    """
+    Executes the request within the quota of the api, retrying rate limit
+    and server errors with exponential backoff.
+    """
+    limiter = get_rate_limiter(api)
+    # Batch requests have no method of their own
+    method = getattr(request, "methodId", None) or "batch"
+    attempt = 0
+    while True:
+        with METRICS.time("api_wait_seconds", service=api):
+            limiter.acquire(tokens)
+        start = time.perf_counter()
+        try:
+            result = request.execute()
+        except HttpError as error:
+            METRICS.observe(
+                "api_request_seconds",
+                time.perf_counter() - start,
+                service=api,
+                method=method,
+                status=str(error.resp.status),
+            )
+            if attempt >= max_retries or not is_retryable(error):
+                limiter.count("failures")
+                raise
+            limiter.count("retries")
+            delay = _backoff(error, attempt)
+            LOGGER.warning(
+                "%s call failed with %s, retrying in %.1fs",
+                api,
+                error.resp.status,
+                delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+        else:
+            METRICS.observe(
+                "api_request_seconds",
+                time.perf_counter() - start,
+                service=api,
+                method=method,
+                status="200",
+            )
+            return result
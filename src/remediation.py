@@ -0,0 +1,163 @@
+from collections import (
+    Counter,
+)
+from googleapiclient.errors import (
+    HttpError,
+)
+from googleapiclient.http import (
+    HttpRequest,
+)
+import logging
+from src.database import (
+    ConnectionPool,
+)
+from src.files import (
+    REMEDIATION_FAILED,
+    REMEDIATION_NOT_PUBLIC,
+    REMEDIATION_REMOVED,
+    REMEDIATION_WOULD_REMOVE,
+    set_remediation_status,
+)
+from src.rate_limit import (
+    execute_request,
+)
+from src.utils import (
+    batched,
+)
+from typing import (
+    Any,
+    Iterable,
+)
+
+LOGGER = logging.getLogger("challeng")
+
+# Google rejects batch requests with more than 100 sub-requests
+MAX_BATCH_SIZE = 100
+
+
+def _execute_batch(
+    service: Any, requests: dict[str, HttpRequest]
+) -> tuple[dict[str, Any], dict[str, Exception]]:
+    """
+    Sends the requests in batches of MAX_BATCH_SIZE and retries the failed
+    sub-requests one at a time.
+    """
+    responses: dict[str, Any] = {}
+    errors: dict[str, Exception] = {}
+
+    def callback(
+        request_id: str, response: Any, exception: Exception | None
+    ) -> None:
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            responses[request_id] = response
+
+    for chunk in batched(requests.items(), MAX_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, request in chunk:
+            batch.add(request, request_id=request_id)
+        # Drive charges every sub-request against the quota
+        execute_request(batch, "drive", tokens=len(chunk))
+
+    for request_id in list(errors):
+        try:
+            responses[request_id] = execute_request(
+                requests[request_id], "drive"
+            )
+        except HttpError as error:
+            errors[request_id] = error
+        else:
+            del errors[request_id]
+    return responses, errors
+
+
+def _get_public_permissions(
+    service: Any, file_ids: list[str]
+) -> tuple[dict[str, list[str]], set[str]]:
+    responses, errors = _execute_batch(
+        service,
+        {
+            file_id: service.permissions().list(
+                fileId=file_id, fields="permissions(id, type)"
+            )
+            for file_id in file_ids
+        },
+    )
+    for file_id, error in errors.items():
+        LOGGER.error("Failed to get permissions of %s: %s", file_id, error)
+    return {
+        file_id: [
+            p["id"]
+            for p in response.get("permissions", [])
+            if p["type"] == "anyone"
+        ]
+        for file_id, response in responses.items()
+    }, set(errors)
+
+
+def _delete_permissions(
+    service: Any, permissions: dict[str, list[str]]
+) -> set[str]:
+    targets = [
+        (file_id, permission_id)
+        for file_id, permission_ids in permissions.items()
+        for permission_id in permission_ids
+    ]
+    _, errors = _execute_batch(
+        service,
+        {
+            str(index): service.permissions().delete(
+                fileId=file_id, permissionId=permission_id
+            )
+            for index, (file_id, permission_id) in enumerate(targets)
+        },
+    )
+    failed_files = set()
+    for request_id, error in errors.items():
+        file_id = targets[int(request_id)][0]
+        LOGGER.error("Failed to remove permission of %s: %s", file_id, error)
+        failed_files.add(file_id)
+    return failed_files
+
+
+def remediate_files(
+    service: Any,
+    connection_pool: ConnectionPool,
+    files: Iterable[dict[str, Any]],
+    *,
+    dry_run: bool = False,
+) -> Counter[str]:
+    """
+    Removes the anyone permissions of the files and stores the outcome of
+    every file, working through MAX_BATCH_SIZE files per batch request.
+    """
+    summary: Counter[str] = Counter()
+    for chunk in batched(files, MAX_BATCH_SIZE):
+        permissions, failed_files = _get_public_permissions(
+            service, [file["file_id"] for file in chunk]
+        )
+        public_files = {
+            file_id: permission_ids
+            for file_id, permission_ids in permissions.items()
+            if permission_ids
+        }
+        if not dry_run:
+            failed_files |= _delete_permissions(service, public_files)
+
+        statuses: dict[str, str] = {}
+        for file in chunk:
+            file_id = file["file_id"]
+            if file_id in failed_files:
+                statuses[file_id] = REMEDIATION_FAILED
+            elif file_id not in public_files:
+                statuses[file_id] = REMEDIATION_NOT_PUBLIC
+            elif dry_run:
+                LOGGER.warning("Would remove public access to %s", file_id)
+                statuses[file_id] = REMEDIATION_WOULD_REMOVE
+            else:
+                statuses[file_id] = REMEDIATION_REMOVED
+        summary.update(statuses.values())
+        if not dry_run:
+            set_remediation_status(connection_pool, statuses)
+    return summary
@@ -0,0 +1,132 @@
+import hashlib
+from google.oauth2.credentials import (
+    Credentials,
+)
+from googleapiclient.discovery import (
+    build,
+)
+from googleapiclient.discovery_cache.base import (
+    Cache,
+)
+import os
+from pathlib import (
+    Path,
+)
+import tempfile
+import threading
+import time
+from src.metrics import (
+    METRICS,
+)
+from typing import (
+    Any,
+    Callable,
+)
+
+DISCOVERY_DOCS = {
+    ("forms", "v1"): "https://forms.googleapis.com/$discovery/rest?version=v1",
+}
+DEFAULT_DISCOVERY_CACHE_TTL = 24 * 60 * 60
+
+_BUILDER: Callable[..., Any] = build
+_LOCAL = threading.local()
+_STATS_LOCK = threading.Lock()
+_STATS = {"built": 0, "reused": 0}
+
+
+class FileDiscoveryCache(Cache):
+    """
+    Keeps the discovery documents on disk so that they are downloaded at
+    most once per TTL instead of once per client.
+    """
+
+    def __init__(self, directory: Path, ttl: int) -> None:
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / f"{digest}.json"
+
+    def get(self, url: str) -> str | None:
+        path = self._path(url)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                return None
+            return path.read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def set(self, url: str, content: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.directory, delete=False, encoding="utf-8"
+        ) as file:
+            file.write(content)
+        os.replace(file.name, self._path(url))
+
+
+def _get_discovery_cache() -> FileDiscoveryCache:
+    return FileDiscoveryCache(
+        Path(
+            os.environ.get(
+                "DISCOVERY_CACHE_DIR",
+                Path.home() / ".cache" / "challeng-r" / "discovery",
+            )
+        ),
+        int(
+            os.environ.get(
+                "DISCOVERY_CACHE_TTL", DEFAULT_DISCOVERY_CACHE_TTL
+            )
+        ),
+    )
+
+
+def _count(stat: str) -> None:
+    with _STATS_LOCK:
+        _STATS[stat] += 1
+    METRICS.inc("api_clients", result=stat)
+
+
+def get_service(api: str, version: str, credentials: Credentials) -> Any:
+    """
+    Returns the API client of the current thread, building it the first
+    time. httplib2 is not thread-safe, so clients are never shared between
+    threads.
+    """
+    services: dict[tuple[str, str], tuple[Credentials, Any]] = (
+        _LOCAL.__dict__.setdefault("services", {})
+    )
+    cached = services.get((api, version))
+    if cached and cached[0] is credentials:
+        _count("reused")
+        return cached[1]
+
+    discovery_url = DISCOVERY_DOCS.get((api, version))
+    service = _BUILDER(
+        api,
+        version,
+        credentials=credentials,
+        cache=_get_discovery_cache(),
+        **(
+            {"discoveryServiceUrl": discovery_url, "static_discovery": False}
+            if discovery_url
+            else {}
+        ),
+    )
+    services[(api, version)] = (credentials, service)
+    _count("built")
+    return service
+
+
+def set_service_builder(builder: Callable[..., Any]) -> None:
+    """
+    Replaces googleapiclient's build, e.g. with local fake APIs.
+    """
+    global _BUILDER  # pylint: disable=global-statement
+    _BUILDER = builder
+
+
+def get_service_stats() -> dict[str, int]:
+    with _STATS_LOCK:
+        return dict(_STATS)
@@ -0,0 +1,113 @@
+import json
+import numpy as np
+import os
+from typing import (
+    Sequence,
+)
+
+ANSWER_WEIGHTS = {
+    "está relacionado con procesos legales o confidenciales?": 4,
+    "es necesario para la operación diaria de la empresa?": 3,
+    "se comparte con partes externas a la organización?": 2,
+    "está en uso activo en proyectos actuales?": 2,
+    "contiene información de uso común y conocida?": 1,
+}
+SEVERITY_LABELS = {
+    4: "Critico",
+    3: "Alto",
+    2: "Medio",
+    1: "Bajo",
+    0: "Desconocido",
+}
+DEFAULT_LABEL = "Desconocido"
+
+
+class SeverityScorer:
+    """
+    Scores many answers at once. The answer options are compiled into
+    integer codes when the scorer is created, so scoring is a table lookup
+    and a grouped max over NumPy arrays.
+    """
+
+    def __init__(
+        self,
+        weights: dict[str, int] | None = None,
+        labels: dict[int, str] | None = None,
+        default_label: str = DEFAULT_LABEL,
+    ) -> None:
+        weights = weights or ANSWER_WEIGHTS
+        labels = labels or SEVERITY_LABELS
+        # Code 0 is kept for the answers that are not an option
+        self._codes = {
+            option: code for code, option in enumerate(weights, start=1)
+        }
+        self._weights = np.array([0, *weights.values()], dtype=np.int64)
+        self._labels = np.array(
+            [
+                labels.get(weight, default_label)
+                for weight in range(int(self._weights.max()) + 1)
+            ],
+            dtype=object,
+        )
+
+    @classmethod
+    def from_env(cls) -> "SeverityScorer":
+        """
+        Reads the weights and labels from the SEVERITY_WEIGHTS and
+        SEVERITY_LABELS JSON objects when they are set.
+        """
+        weights = os.environ.get("SEVERITY_WEIGHTS")
+        labels = os.environ.get("SEVERITY_LABELS")
+        return cls(
+            json.loads(weights) if weights else None,
+            (
+                {int(key): value for key, value in json.loads(labels).items()}
+                if labels
+                else None
+            ),
+        )
+
+    def encode(self, answers: Sequence[str]) -> np.ndarray:
+        codes = self._codes
+        return np.fromiter(
+            (codes.get(answer, 0) for answer in answers),
+            dtype=np.int64,
+            count=len(answers),
+        )
+
+    def score(
+        self, question_ids: Sequence[str], answers: Sequence[str]
+    ) -> dict[str, str]:
+        """
+        Returns the severity label of every question, given the question
+        of every answer in question_ids and its text in answers.
+        """
+        if not question_ids:
+            return {}
+        questions, question_index = factorize(question_ids)
+        weights = self._weights[self.encode(answers)]
+        max_weights = np.zeros(len(questions), dtype=np.int64)
+        np.maximum.at(max_weights, question_index, weights)
+        return dict(zip(questions, self._labels[max_weights].tolist()))
+
+
+def factorize(values: Sequence[str]) -> tuple[list[str], np.ndarray]:
+    """
+    Returns the distinct values and the position of every value among
+    them. The values are sorted as fixed-width strings, never as Python
+    objects. Form question ids are 8 hex characters, which are sorted as
+    64-bit integers.
+    """
+    try:
+        encoded = np.array(values, dtype="S")
+    except UnicodeEncodeError:
+        uniques, index = np.unique(np.array(values), return_inverse=True)
+        return uniques.tolist(), index
+    if encoded.dtype.itemsize <= 8:
+        uniques, index = np.unique(
+            encoded.astype("S8").view(np.uint64), return_inverse=True
+        )
+        uniques = uniques.view("S8")
+    else:
+        uniques, index = np.unique(encoded, return_inverse=True)
+    return [value.decode() for value in uniques.tolist()], index
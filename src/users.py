@@ -2,82 +2,142 @@ from __future__ import (
     print_function,
 )
 
-from concurrent.futures import (
-    ThreadPoolExecutor,
-)
 import logging
 import mysql.connector
 from mysql.connector.connection import (
     MySQLConnection,
 )
 from src.database import (
-    get_connection,
+    ConnectionPool,
+    get_batch_size,
+    multi_row_placeholders,
+)
+from src.rate_limit import (
+    execute_request,
+)
+from src.utils import (
+    batched,
 )
 from typing import (
     Any,
-    Dict,
-    List,
+    Iterable,
+    Iterator,
 )
 
-LOGGER = logging.Logger("challeng")
+LOGGER = logging.getLogger("challeng")
+
+# files.list accepts at most 1000 items per page
+MAX_PAGE_SIZE = 1000
+DRIVE_FILE_FIELDS = (
+    "id, name, owners, fullFileExtension, originalFilename, permissions, "
+    "webViewLink"
+)
 
 
-def add_user_record(
-    connection: MySQLConnection | None,
-    user_email: str,
-    user_name: str,
-) -> bool:
-    connection = connection or get_connection()
+def add_user_records(
+    connection_pool: ConnectionPool,
+    users: Iterable[tuple[str, str]],
+    batch_size: int | None = None,
+) -> int:
+    """
+    Upserts (user_email, user_name) pairs in multi-row statements, one
+    transaction per batch.
+    """
+    batch_size = batch_size or get_batch_size()
+    affected_rows = 0
+    connection = connection_pool.get_connection()
     try:
         cursor = connection.cursor()
-        add_file_query = (
-            "INSERT INTO google_drive_users "
-            "(user_email, user_name) "
-            "VALUES (%s,%s)"
-        )
-        file_data = (user_email, user_name)
-        cursor.execute(add_file_query, file_data)
-        connection.commit()
-
+        for batch in batched(users, batch_size):
+            query = (
+                "INSERT INTO google_drive_users "
+                "(user_email, user_name) "
+                f"VALUES {multi_row_placeholders(len(batch), 2)} AS new "
+                "ON DUPLICATE KEY UPDATE user_name = new.user_name"
+            )
+            values = [value for user in batch for value in user]
+            try:
+                cursor.execute(query, values)
+                connection.commit()
+            except mysql.connector.Error as err:
+                connection.rollback()
+                LOGGER.error("Failed to add user records: %s", err)
+                raise
+            affected_rows += cursor.rowcount
         cursor.close()
-    except mysql.connector.Error as err:
-        if err.errno not in (1062,):
-            LOGGER.error("Failed to add user record: %s", err)
-
+    finally:
+        connection.close()
+    return affected_rows
 
-def get_user_files(service: Any) -> List[dict[str, Any]]:
-    request = service.files().list(
-        pageSize=10,
-        fields="nextPageToken, files(id, name, owners, fullFileExtension, originalFilename, permissions, webViewLink)",
-    )
-    results = request.execute()
-    items: List[Dict[str, Any]] = results.get("files", [])
 
+def get_user_files_pages(
+    service: Any, page_size: int = MAX_PAGE_SIZE, page_token: str | None = None
+) -> Iterator[tuple[list[dict[str, Any]], str | None]]:
+    """
+    Yields the user's files one page at a time, starting at page_token,
+    together with the token of the next page, which is None on the last
+    one. Callers never hold more than one page in memory.
+    """
     while True:
-        if "nextPageToken" in results:
-            request = service.files().list_next(
-                previous_request=request, previous_response=results
-            )
-            results = request.execute()
-            items.extend(results.get("files", []))
-            break
-        else:
-            break
-    return items
+        results = execute_request(
+            service.files().list(
+                pageSize=page_size,
+                fields=f"nextPageToken, files({DRIVE_FILE_FIELDS})",
+                **({"pageToken": page_token} if page_token else {}),
+            ),
+            "drive",
+        )
+        page_token = results.get("nextPageToken")
+        yield results.get("files", []), page_token
+        if page_token is None:
+            return
 
 
-def create_users(files_raw: list[dict[str, Any]]) -> None:
+def extract_users(files_raw: list[dict[str, Any]]) -> dict[str, str]:
+    """
+    Returns the owners and the users with a permission on the files,
+    deduplicated by email.
+    """
     users: dict[str, str] = {}
     for file in files_raw:
-        for owner in file["owners"]:
-            if owner["emailAddress"] in users:
+        people = [
+            *file.get("owners", []),
+            *(p for p in file.get("permissions", []) if p["type"] == "user"),
+        ]
+        for person in people:
+            email = person.get("emailAddress")
+            if not email or email in users:
                 continue
-            users[owner["emailAddress"]] = owner["displayName"]
+            users[email] = person.get("displayName") or email
+    return users
 
-    with ThreadPoolExecutor() as worker:
-        worker.map(
-            add_user_record, [None] * len(users), users.keys(), users.values()
-        )
+
+def create_users(
+    connection_pool: ConnectionPool,
+    files_raw: list[dict[str, Any]],
+    known_users: set[str],
+) -> int:
+    """
+    Stores the users of the files that are not in known_users yet and adds
+    them to it.
+    """
+    new_users = {
+        email: name
+        for email, name in extract_users(files_raw).items()
+        if email not in known_users
+    }
+    if new_users:
+        add_user_records(connection_pool, new_users.items())
+        known_users.update(new_users)
+    return len(new_users)
+
+
+def get_user_emails(connection: MySQLConnection) -> set[str]:
+    cursor = connection.cursor()
+    cursor.execute("SELECT user_email FROM google_drive_users")
+    result = {user_email for (user_email,) in cursor}
+    cursor.close()
+    return result
 
 
 def get_all_users(connection: MySQLConnection) -> list[str]:
@@ -0,0 +1,16 @@
+from itertools import (
+    islice,
+)
+from typing import (
+    Iterable,
+    Iterator,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
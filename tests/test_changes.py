@@ -0,0 +1,28 @@
+from src.changes import (
+    split_changes,
+)
+
+OWNER = {"emailAddress": "owner@example.com"}
+
+
+def test_split_changes() -> None:
+    changed_file = {"id": "changed", "owners": [OWNER]}
+    changes = [
+        {"fileId": "changed", "file": changed_file},
+        {"fileId": "removed", "removed": True},
+        {"fileId": "trashed", "file": {"id": "trashed", "trashed": True}},
+        {"fileId": "no-file"},
+        # Files shared with the user have no owners in the domain
+        {"fileId": "shared", "file": {"id": "shared"}},
+        # Changes to shared drives have no fileId
+        {"driveId": "drive"},
+    ]
+
+    changed, removed = split_changes(changes)
+
+    assert changed == [changed_file]
+    assert removed == ["removed", "trashed", "no-file"]
+
+
+def test_split_no_changes() -> None:
+    assert split_changes([]) == ([], [])
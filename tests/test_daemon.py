@@ -0,0 +1,69 @@
+import pytest
+from src import (
+    daemon,
+)
+from src.daemon import (
+    Daemon,
+    Job,
+)
+import threading
+import time
+from typing import (
+    Callable,
+)
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_daemon_skips_a_run_while_the_previous_one_is_running(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(daemon, "SCHEDULER_TICK", 0.01)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_run() -> None:
+        started.set()
+        release.wait()
+
+    job = Job("slow", 0.01, slow_run)
+    runner = Daemon([job])
+    runner.start()
+    try:
+        started.wait(5)
+        _wait_for(lambda: job.skipped >= 2)
+        # No run was queued behind the one in progress
+        assert runner.status()["queue_depth"] == 0
+        assert job.running
+        assert job.runs == 0
+    finally:
+        release.set()
+        runner.stop()
+
+    assert job.runs >= 1
+    assert job.failures == 0
+    assert not job.pending
+
+
+def test_daemon_records_failed_runs(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(daemon, "SCHEDULER_TICK", 0.01)
+
+    def failing_run() -> None:
+        raise RuntimeError("boom")
+
+    job = Job("failing", 3600, failing_run)
+    runner = Daemon([job])
+    runner.start()
+    try:
+        _wait_for(lambda: job.runs == 1)
+    finally:
+        runner.stop()
+
+    assert job.failures == 1
+    assert job.last_error == "boom"
+    assert job.status()["last_error"] == "boom"
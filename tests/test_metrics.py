@@ -0,0 +1,32 @@
+from src.metrics import (
+    MetricsRegistry,
+)
+
+
+def test_render() -> None:
+    metrics = MetricsRegistry()
+    metrics.describe("api_calls", "Calls to the Google APIs")
+    metrics.inc("api_calls", service="drive")
+    metrics.inc("api_calls", 2, service="drive")
+    metrics.observe("stage_seconds", 0.25, command="scan", stage="total")
+    metrics.observe("stage_seconds", 0.5, command="scan", stage="total")
+    # Collectors set their gauges on every render
+    metrics.add_collector(
+        lambda registry: registry.set("pool_size", 5, pool='main "db"')
+    )
+
+    assert metrics.render() == (
+        "# TYPE challeng_api_calls counter\n"
+        "# HELP challeng_api_calls Calls to the Google APIs\n"
+        'challeng_api_calls_total{service="drive"} 3\n'
+        "# TYPE challeng_pool_size gauge\n"
+        'challeng_pool_size{pool="main \\"db\\""} 5\n'
+        "# TYPE challeng_stage_seconds summary\n"
+        'challeng_stage_seconds_count{command="scan",stage="total"} 2\n'
+        'challeng_stage_seconds_sum{command="scan",stage="total"} 0.750000\n'
+        "# EOF\n"
+    )
+
+
+def test_render_empty() -> None:
+    assert MetricsRegistry().render() == "# EOF\n"
@@ -0,0 +1,28 @@
+from src.migrations import (
+    _get_migrations,
+    _split_statements,
+)
+
+
+def test_split_statements() -> None:
+    sql = """
+-- A comment; with a semicolon
+CREATE TABLE a (
+    id INT
+);
+  -- An indented comment
+ALTER TABLE a ADD COLUMN b INT;
+
+"""
+
+    assert _split_statements(sql) == [
+        "CREATE TABLE a (\n    id INT\n)",
+        "ALTER TABLE a ADD COLUMN b INT",
+    ]
+
+
+def test_split_every_migration() -> None:
+    for _, path in _get_migrations():
+        statements = _split_statements(path.read_text())
+        assert statements
+        assert all(statement.split()[0].isupper() for statement in statements)
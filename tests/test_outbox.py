@@ -0,0 +1,90 @@
+from email import (
+    message_from_bytes,
+    policy,
+)
+import json
+from src.email_manage import (
+    CHANGE_PERMISSION_SUBJECT,
+    DIGEST_SUBJECT,
+    FORM_SUBJECT,
+    SENDER,
+    compile_template,
+    render_message,
+)
+from src.outbox import (
+    DIGEST_SEPARATOR,
+    KIND_CHANGE_PERMISSION,
+    KIND_FORM,
+    render_digest,
+)
+from typing import (
+    Any,
+)
+
+RECIPIENT = "owner@example.com"
+FILE = {
+    "file_id": "file",
+    "file_name": "Presupuesto",
+    "file_url": "https://drive.google.com/file/d/file",
+}
+
+
+def _parse(raw: bytes) -> Any:
+    return message_from_bytes(raw, policy=policy.default)
+
+
+def _subject(message: Any) -> str:
+    # Long subjects are folded after "Subject:", as EmailMessage does
+    return message["Subject"].strip()
+
+
+def test_render_message_from_a_compiled_template() -> None:
+    body = "Encuesta: https://forms.gle/ñandú"
+
+    message = _parse(
+        render_message(
+            compile_template(CHANGE_PERMISSION_SUBJECT), RECIPIENT, body
+        )
+    )
+
+    assert message["From"] == SENDER
+    assert message["To"] == RECIPIENT
+    assert _subject(message) == CHANGE_PERMISSION_SUBJECT
+    assert message.get_content().rstrip("\n") == body
+
+
+def test_render_digest_of_one_kind_keeps_its_subject() -> None:
+    rows = [
+        {
+            "kind": KIND_FORM,
+            # Payloads are read from MySQL as JSON strings
+            "payload": json.dumps({"form_link": f"https://forms.gle/{index}"}),
+        }
+        for index in range(2)
+    ]
+
+    message = _parse(render_digest(RECIPIENT, rows))
+
+    assert _subject(message) == FORM_SUBJECT
+    assert message.get_content().rstrip("\n") == DIGEST_SEPARATOR.join(
+        ["Encuesta: https://forms.gle/0", "Encuesta: https://forms.gle/1"]
+    )
+
+
+def test_render_digest_of_several_kinds() -> None:
+    rows = [
+        {"kind": KIND_FORM, "payload": {"form_link": "https://forms.gle/0"}},
+        {"kind": KIND_CHANGE_PERMISSION, "payload": {"files": [FILE]}},
+    ]
+
+    message = _parse(render_digest(RECIPIENT, rows))
+
+    assert message["To"] == RECIPIENT
+    assert _subject(message) == DIGEST_SUBJECT
+    sections = message.get_content().split(DIGEST_SEPARATOR)
+    assert sections[0] == "Encuesta: https://forms.gle/0"
+    assert (
+        sections[1]
+        .rstrip("\n")
+        .endswith(f"{FILE['file_name']} {FILE['file_url']}")
+    )
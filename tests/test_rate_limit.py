@@ -0,0 +1,115 @@
+from datetime import (
+    date,
+    timedelta,
+)
+from googleapiclient.errors import (
+    HttpError,
+)
+import httplib2
+import json
+import pytest
+from src import (
+    rate_limit,
+)
+from src.rate_limit import (
+    BACKOFF_MAX,
+    QuotaExhaustedError,
+    RateLimiter,
+    _backoff,
+    is_retryable,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _http_error(
+    status: int, content: bytes = b"", retry_after: str | None = None
+) -> HttpError:
+    headers = {"status": str(status)}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), content)
+
+
+def _reason(reason: str) -> bytes:
+    return json.dumps({"error": {"errors": [{"reason": reason}]}}).encode()
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def test_acquire_within_the_burst_does_not_wait(clock: FakeClock) -> None:
+    limiter = RateLimiter("drive", 10.0, 0)
+    for _ in range(10):
+        limiter.acquire()
+    assert clock.sleeps == []
+    assert limiter.stats["calls"] == 10
+
+
+def test_acquire_bigger_than_the_bucket_goes_into_debt(
+    clock: FakeClock,
+) -> None:
+    limiter = RateLimiter("gmail", 10.0, 0)
+    limiter.acquire(25)
+    assert clock.sleeps == []
+    # The next call waits until the debt of 15 tokens and its own are paid
+    limiter.acquire()
+    assert clock.sleeps == [pytest.approx(1.6)]
+    assert limiter.stats["calls"] == 26
+    assert limiter.stats["throttled_seconds"] == pytest.approx(1.6)
+
+
+def test_acquire_stops_at_the_daily_budget(
+    clock: FakeClock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    limiter = RateLimiter("gmail", 100.0, 3)
+    for _ in range(3):
+        limiter.acquire()
+    with pytest.raises(QuotaExhaustedError):
+        limiter.acquire()
+    assert limiter.stats["used_today"] == 3
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls) -> date:
+            return date.today() + timedelta(days=1)
+
+    monkeypatch.setattr(rate_limit, "date", Tomorrow)
+    limiter.acquire()
+    assert limiter.stats["used_today"] == 1
+
+
+def test_is_retryable() -> None:
+    assert is_retryable(_http_error(429))
+    assert is_retryable(_http_error(503))
+    assert is_retryable(_http_error(403, _reason("userRateLimitExceeded")))
+    assert not is_retryable(_http_error(403, _reason("insufficientFiles")))
+    assert not is_retryable(_http_error(403, b"Forbidden"))
+    assert not is_retryable(_http_error(404))
+
+
+def test_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    # The upper bound of the jitter
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+    assert _backoff(_http_error(429), 0) == 1.0
+    assert _backoff(_http_error(429), 3) == 8.0
+    assert _backoff(_http_error(429), 20) == BACKOFF_MAX
+    # Retry-After wins when it asks for more
+    assert _backoff(_http_error(429, retry_after="30"), 0) == 30.0
+    assert _backoff(_http_error(429, retry_after="2"), 3) == 8.0
+    assert _backoff(_http_error(429, retry_after="soon"), 0) == 1.0
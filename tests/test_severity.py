@@ -0,0 +1,66 @@
+import random
+from src.severity import (
+    ANSWER_WEIGHTS,
+    SeverityScorer,
+    factorize,
+)
+
+
+def _score_question(answers: list[dict[str, str]]) -> str:
+    # The per-question scoring that SeverityScorer replaced
+    answers_map = {
+        "está relacionado con procesos legales o confidenciales?": 4,
+        "es necesario para la operación diaria de la empresa?": 3,
+        "se comparte con partes externas a la organización?": 2,
+        "está en uso activo en proyectos actuales?": 2,
+        "contiene información de uso común y conocida?": 1,
+    }
+    severity_map = {
+        4: "Critico",
+        3: "Alto",
+        2: "Medio",
+        1: "Bajo",
+        0: "Desconocido",
+    }
+    severities = []
+    for answer in answers:
+        if severity_value := answers_map.get(answer["value"]):
+            severities.append(severity_value)
+    return severity_map.get(
+        (max(severities) if severities else 0), "Desconocido"
+    )
+
+
+def test_score_matches_the_per_question_scoring() -> None:
+    rng = random.Random(0)
+    options = [*ANSWER_WEIGHTS, "", "otra respuesta"]
+    question_ids = [f"q{rng.randrange(200)}" for _ in range(2000)]
+    answers = [rng.choice(options) for _ in question_ids]
+
+    answers_by_question: dict[str, list[dict[str, str]]] = {}
+    for question_id, answer in zip(question_ids, answers):
+        answers_by_question.setdefault(question_id, []).append(
+            {"value": answer}
+        )
+    expected = {
+        question_id: _score_question(question_answers)
+        for question_id, question_answers in answers_by_question.items()
+    }
+
+    assert SeverityScorer().score(question_ids, answers) == expected
+
+
+def test_score_without_answers() -> None:
+    assert SeverityScorer().score([], []) == {}
+
+
+def test_factorize_ids_of_any_width() -> None:
+    # Ids of up to 8 bytes are sorted as integers, the rest as strings
+    for values in (
+        ["b", "a", "b", "a0"],
+        ["pregunta1", "a", "pregunta1"],
+        ["ñ", "a", "ñ"],
+    ):
+        uniques, index = factorize(values)
+        assert sorted(uniques) == sorted(set(values))
+        assert [uniques[position] for position in index] == values